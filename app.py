@@ -1,74 +1,128 @@
-
-## 2) `app.py`
-
-import os
+import tempfile
 import uuid
-from datetime import date
+from concurrent.futures import Future
+from datetime import date, datetime, time
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 import streamlit as st
-from sqlalchemy import select
-
-from auth import hash_password, verify_password
-from db import engine, get_db_session
-from models import Base, Document, FamilyMember, User
-from storage import get_storage_adapter
-
-Base.metadata.create_all(bind=engine)
+from sqlalchemy import select, update
+
+from auth import hash_password, hash_password_async, login_rate_limiter, needs_rehash, verify_password_async
+from cache import (
+    cached_document_facets,
+    cached_document_page,
+    cached_family_members,
+    cached_member_stats,
+    invalidate_documents,
+    invalidate_members,
+    query_cache,
+)
+from db import check_database, engine, get_db_session, pool_metrics
+from deletion import delete_documents, delete_member
+from export import EXPORT_FORMATS, EXPORT_UI_MAX_BYTES, ExportTooLarge, export_archive
+from identity import get_current_user, is_admin, principal_for, set_current_user
+from instrumentation import RerunStats, metrics, start_metrics_server, track_rerun
+from jobs import (
+    FAILED,
+    JOB_POLL_SECONDS,
+    JOB_QUEUE_ENABLED,
+    QUEUED,
+    RUNNING,
+    dismiss_failed_jobs,
+    job_counts,
+    latest_job_error,
+    member_tag,
+    retry_failed_jobs,
+)
+from models import FamilyMember, User
+from queries import DocumentFilters, MemberStats, normalize_email, user_by_email
+from schema import ensure_schema
+from storage import get_storage_adapter, signed_urls
+from uploads import PendingUpload, UploadError, store_documents
+
+check_database(engine)
+ensure_schema(engine)
+start_metrics_server()
+
+LOGIN_POLL_SECONDS = 0.25
+
+
+def rehash_on_success(verified: Future, user_id: uuid.UUID, password: str) -> None:
+    """Re-hash at the current cost once `verified` confirms the password, off the script thread."""
+
+    def store(hashed: Future) -> None:
+        with get_db_session() as db:
+            db.execute(update(User).where(User.id == user_id).values(password_hash=hashed.result()))
+            db.commit()
 
+    def rehash(done: Future) -> None:
+        if done.exception() is None and done.result():
+            hash_password_async(password).add_done_callback(store)
 
-def get_current_user():
-    return st.session_state.get("current_user")
+    verified.add_done_callback(rehash)
 
 
-def set_current_user(user: User | None):
-    if user is None:
-        st.session_state.pop("current_user", None)
+@st.fragment(run_every=LOGIN_POLL_SECONDS)
+def login_progress():
+    future, user_id, email, role = st.session_state["pending_login"]
+    if not future.done():
+        st.info("Signing in...")
         return
-    st.session_state["current_user"] = {
-        "id": str(user.id),
-        "email": user.email,
-        "role": user.role,
-    }
-
-
-def is_admin():
-    user = get_current_user()
-    return user and user["role"] == "admin"
+    del st.session_state["pending_login"]
+    if future.exception() is not None or not future.result():
+        st.session_state["login_error"] = "Invalid credentials"
+        st.rerun()
+    principal = principal_for(user_id, email, role)
+    if principal is None:
+        st.session_state["login_error"] = "Your account has no access role. Ask an admin to grant one."
+        st.rerun()
+    set_current_user(principal)
+    st.session_state["page"] = "family_members"
+    st.session_state.pop("member_id", None)
+    st.rerun()
 
 
 def login_form():
     st.header("Sign in")
+    if "pending_login" in st.session_state:
+        # bcrypt runs on the hash pool; this session polls it instead of
+        # holding the script thread for the whole check.
+        login_progress()
+        return
+    if "login_error" in st.session_state:
+        st.error(st.session_state.pop("login_error"))
     email = st.text_input("Email")
     password = st.text_input("Password", type="password")
 
     if st.button("Sign in"):
+        if not login_rate_limiter.allow(normalize_email(email)):
+            st.error("Too many sign-in attempts. Please wait a minute and try again.")
+            return
         with get_db_session() as db:
-            user = db.execute(select(User).where(User.email == email)).scalar_one_or_none()
-            if not user or not verify_password(password, user.password_hash):
-                st.error("Invalid credentials")
-                return
-            set_current_user(user)
-            st.session_state["page"] = "family_members"
-            st.session_state.pop("member_id", None)
-            st.success("Signed in")
-            st.rerun()
+            user = user_by_email(db, email)
+        if not user:
+            st.error("Invalid credentials")
+            return
+        future = verify_password_async(password, user.password_hash)
+        if needs_rehash(user.password_hash):
+            rehash_on_success(future, user.id, password)
+        st.session_state["pending_login"] = (future, user.id, user.email, user.role)
+        st.rerun()
 
     st.divider()
     st.subheader("New here?")
     with st.expander("Register"):
-        new_email = st.text_input("New email")
+        new_email = normalize_email(st.text_input("New email"))
         new_password = st.text_input("New password", type="password")
         if st.button("Create account"):
             if not new_email or not new_password:
                 st.error("Email and password are required")
                 return
             with get_db_session() as db:
-                existing = db.execute(select(User).where(User.email == new_email)).scalar_one_or_none()
-                if existing:
+                if user_by_email(db, new_email):
                     st.error("Email already registered")
                     return
                 user = User(email=new_email, password_hash=hash_password(new_password), role="admin")
@@ -86,19 +140,74 @@ def app_header():
             set_current_user(None)
             st.rerun()
 
+
+def export_controls(member_ids: list[uuid.UUID] | None, key: str, file_stem: str):
+    format_col, since_col = st.columns(2)
+    fmt = format_col.selectbox("Format", EXPORT_FORMATS, key=f"{key}_format")
+    since_date = since_col.date_input("Only documents added after (optional)", value=None, key=f"{key}_since")
+    if st.button("Prepare export", key=f"{key}_prepare"):
+        since = datetime.combine(since_date, time.max) if since_date else None
+        # The archive is streamed to a temporary file, but Streamlit's media
+        # store holds the finished download in memory, hence the cap.
+        with tempfile.TemporaryFile() as archive:
+            try:
+                with st.spinner("Building archive..."):
+                    summary = export_archive(
+                        get_storage_adapter(), archive, fmt, member_ids, since, max_bytes=EXPORT_UI_MAX_BYTES
+                    )
+            except ExportTooLarge:
+                st.warning(
+                    f"This export is larger than {format_bytes(EXPORT_UI_MAX_BYTES)}. "
+                    "Narrow it with a date, or run `python export.py` on the server."
+                )
+                return
+            archive.seek(0)
+            st.download_button(
+                f"Download {summary.documents} document(s)",
+                archive.read(),
+                file_name=f"{file_stem}-{date.today()}.{fmt}",
+                key=f"{key}_download",
+            )
+
+
+def format_bytes(size: int | None) -> str:
+    if size is None:
+        return "—"
+    if size < 1000:
+        return f"{size} B"
+    for unit in ("KB", "MB", "GB"):
+        size /= 1000
+        if size < 1000 or unit == "GB":
+            return f"{size:.1f} {unit}"
+
+
+def stats_label(stats: MemberStats) -> str:
+    if not stats.documents:
+        return "No documents yet"
+    noun = "document" if stats.documents == 1 else "documents"
+    label = f"{stats.documents} {noun} · latest {stats.latest_doc_date} · {format_bytes(stats.total_bytes)}"
+    if stats.top_conditions:
+        label += f"\nTop conditions: {', '.join(stats.top_conditions)}"
+    return label
+
+
 def family_members_tab():
-    with get_db_session() as db:
-        members = db.execute(select(FamilyMember).order_by(FamilyMember.created_at.desc())).scalars().all()
+    members = cached_family_members()
+    stats = cached_member_stats()
 
     st.subheader("Family Members")
     for index, member in enumerate(members, start=1):
         dob_label = f"DOB: {member.dob or 'Not provided'}"
-        card_label = f"{index}. {member.full_name}\n{dob_label}"
+        card_label = f"{index}. {member.full_name}\n{dob_label}\n{stats_label(stats.get(member.id, MemberStats()))}"
         if st.button(card_label, key=f"member_{member.id}", use_container_width=True):
             st.session_state["member_id"] = member.id
             st.session_state["navigate_to"] = "member_documents"
             st.rerun()
 
+    if is_admin() and members:
+        with st.expander("Export all records"):
+            export_controls(None, "export_all", "family-records")
+
 
 def add_member_tab():
     if not is_admin():
@@ -129,18 +238,58 @@ def add_member_tab():
                     if existing:
                         st.error("A family member with the same name and date of birth already exists.")
                         return
-                    creator = db.execute(select(User).where(User.email == get_current_user()["email"]))
-                    creator_user = creator.scalar_one()
-                    member = FamilyMember(full_name=name, dob=dob, created_by=creator_user.id)
+                    member = FamilyMember(full_name=name, dob=dob, created_by=get_current_user().id)
                     db.add(member)
                     db.commit()
+                invalidate_members()
                 st.success("Member added")
                 st.rerun()
 
 
-def member_detail():
+def member_job_counts(member_id: uuid.UUID) -> dict[str, int]:
     with get_db_session() as db:
-        members = db.execute(select(FamilyMember).order_by(FamilyMember.created_at.desc())).scalars().all()
+        return job_counts(db, member_tag(member_id))
+
+
+def pending_jobs(counts: dict[str, int]) -> int:
+    return counts.get(QUEUED, 0) + counts.get(RUNNING, 0)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(member_id: uuid.UUID):
+    pending = pending_jobs(member_job_counts(member_id))
+    if pending:
+        st.info(f"Processing {pending} background job(s)…")
+        return
+    # The worker runs in another process, so this session drops what it
+    # cached before the jobs finished.
+    invalidate_documents(member_id)
+    st.rerun()
+
+
+def failed_jobs_notice(member_id: uuid.UUID, failed: int):
+    tag = member_tag(member_id)
+    with get_db_session() as db:
+        last_error = latest_job_error(db, tag)
+    message = f"{failed} background job(s) failed after retrying."
+    if last_error:
+        message += f" Last error: {last_error[:200]}"
+    st.warning(message)
+    retry_col, dismiss_col = st.columns(2)
+    if retry_col.button("Retry failed jobs", key=f"retry_jobs_{member_id}"):
+        with get_db_session() as db:
+            retry_failed_jobs(db, tag)
+            db.commit()
+        st.rerun()
+    if dismiss_col.button("Dismiss", key=f"dismiss_jobs_{member_id}"):
+        with get_db_session() as db:
+            dismiss_failed_jobs(db, tag)
+            db.commit()
+        st.rerun()
+
+
+def member_detail():
+    members = cached_family_members()
 
     if not members:
         st.info("No family members found. Add a member to get started.")
@@ -170,20 +319,22 @@ def member_detail():
     )
     st.session_state["member_id"] = selected_id
 
-    with get_db_session() as db:
-        member = db.get(FamilyMember, selected_id)
-        if not member:
-            st.error("Member not found")
-            st.session_state.pop("member_id", None)
-            return
-        documents = (
-            db.execute(select(Document).where(Document.member_id == member.id).order_by(Document.created_at.desc()))
-            .scalars()
-            .all()
-        )
+    member = next((member for member in members if member.id == selected_id), None)
+    if not member:
+        st.error("Member not found")
+        st.session_state.pop("member_id", None)
+        return
+    facets = cached_document_facets(member.id)
 
     st.subheader(member.full_name)
     st.caption(f"DOB: {member.dob or 'Not provided'}")
+    # Without a worker nothing is ever queued, so skip the query entirely.
+    if JOB_QUEUE_ENABLED:
+        counts = member_job_counts(member.id)
+        if counts.get(FAILED):
+            failed_jobs_notice(member.id, counts[FAILED])
+        if pending_jobs(counts):
+            job_progress(member.id)
 
     if is_admin():
         with st.expander("Danger zone", expanded=False):
@@ -193,23 +344,24 @@ def member_detail():
                 if not st.session_state.get(confirm_key):
                     st.warning("Please confirm deletion before proceeding.")
                 else:
-                    adapter = get_storage_adapter()
-                    for document in documents:
-                        try:
-                            adapter.delete(document.storage_key)
-                        except Exception as exc:
-                            st.error(f"Failed to delete file from storage: {exc}")
-                            return
-                    with get_db_session() as db:
-                        record = db.get(FamilyMember, member.id)
-                        if record:
-                            db.delete(record)
-                            db.commit()
+                    try:
+                        pending = delete_member(get_storage_adapter(), member.id)
+                    except Exception as exc:
+                        st.error(f"Failed to delete member: {exc}")
+                        return
+                    invalidate_members()
+                    invalidate_documents(member.id)
+                    if pending:
+                        st.warning(f"{len(pending)} file(s) could not be removed from storage yet and will be retried.")
                     st.success("Member deleted")
                     st.session_state.pop("member_id", None)
                     st.session_state["navigate_to"] = "family_members"
                     st.rerun()
 
+    if is_admin():
+        with st.expander("Export records", expanded=False):
+            export_controls([member.id], f"export_{member.id}", f"{member.full_name}-records")
+
     if is_admin():
         with st.expander("Upload Documents", expanded=True):
             with st.form("upload_document"):
@@ -229,47 +381,51 @@ def member_detail():
                     elif not files:
                         st.error("Please select at least one file")
                     else:
-                        adapter = get_storage_adapter()
-                        with get_db_session() as db:
-                            uploader = db.execute(select(User).where(User.email == get_current_user()["email"]))
-                            uploader_user = uploader.scalar_one()
-                            for file in files:
-                                storage_key = adapter.upload(
-                                    file.getvalue(),
-                                    file.name,
-                                    file.type or "application/octet-stream",
+                        progress_bars = [st.progress(0.0, text=file.name) for file in files]
+
+                        def show_progress(progress):
+                            for bar, file, (sent, total) in zip(progress_bars, files, progress):
+                                total = total or file.size
+                                bar.progress(
+                                    min(1.0, sent / total) if total else 0.0,
+                                    text=f"{file.name}: {sent / 1_000_000:.1f} / {total / 1_000_000:.1f} MB",
                                 )
-                                document = Document(
-                                    member_id=member.id,
-                                    uploaded_by=uploader_user.id,
-                                    doc_date=doc_date,
-                                    condition=condition,
-                                    description=description,
-                                    storage_key=storage_key,
-                                    file_name=file.name,
-                                    mime_type=file.type or "application/octet-stream",
-                                )
-                                db.add(document)
-                            db.commit()
+
+                        try:
+                            store_documents(
+                                get_storage_adapter(),
+                                [
+                                    PendingUpload(file, file.name, file.type or "application/octet-stream")
+                                    for file in files
+                                ],
+                                member_id=member.id,
+                                uploaded_by=get_current_user().id,
+                                doc_date=doc_date,
+                                condition=condition,
+                                description=description,
+                                on_progress=show_progress,
+                            )
+                        except UploadError as exc:
+                            st.error(str(exc))
+                            return
+                        invalidate_documents(member.id)
                         st.success(f"Uploaded {len(files)} document(s)")
                         st.rerun()
 
     st.divider()
     with st.expander("Existing Documents", expanded=True):
-        if not documents:
+        if facets.min_date is None:
             st.info("No documents uploaded yet.")
             return
 
-        conditions = sorted({doc.condition for doc in documents if doc.condition})
-        mime_types = sorted({doc.mime_type for doc in documents if doc.mime_type})
-        min_date = min(doc.created_at.date() for doc in documents)
-        max_date = max(doc.created_at.date() for doc in documents)
+        min_date = facets.min_date
+        max_date = facets.max_date
 
         st.markdown("#### Filters")
         filter_col1, filter_col2, filter_col3 = st.columns([2, 2, 2])
         search_text = filter_col1.text_input("Search", placeholder="Condition, filename, description")
-        selected_condition = filter_col2.selectbox("Condition", ["All"] + conditions)
-        selected_type = filter_col3.selectbox("File type", ["All"] + mime_types)
+        selected_condition = filter_col2.selectbox("Condition", ["All"] + facets.conditions)
+        selected_type = filter_col3.selectbox("File type", ["All"] + facets.mime_types)
         date_range = st.date_input(
             "Uploaded between", value=(min_date, max_date), min_value=min_date, max_value=max_date
         )
@@ -279,46 +435,57 @@ def member_detail():
         else:
             start_date = end_date = date_range
 
-        def matches_filters(doc: Document) -> bool:
-            if selected_condition != "All" and doc.condition != selected_condition:
-                return False
-            if selected_type != "All" and doc.mime_type != selected_type:
-                return False
-            if search_text:
-                haystack = " ".join(
-                    [
-                        doc.condition or "",
-                        doc.file_name or "",
-                        doc.description or "",
-                    ]
-                ).lower()
-                if search_text.lower() not in haystack:
-                    return False
-            uploaded_date = doc.created_at.date()
-            if uploaded_date < start_date or uploaded_date > end_date:
-                return False
-            return True
-
-        filtered_docs = [doc for doc in documents if matches_filters(doc)]
+        filters = DocumentFilters(
+            search_text=search_text.strip(),
+            condition=None if selected_condition == "All" else selected_condition,
+            mime_type=None if selected_type == "All" else selected_type,
+            start_date=start_date,
+            end_date=end_date,
+        )
+
+        # Keyset pagination: a stack of cursors, one per page visited, reset
+        # whenever the filters change.
+        pages_key = f"doc_pages_{member.id}"
+        pages = st.session_state.get(pages_key)
+        if not pages or pages["filters"] != filters:
+            pages = {"filters": filters, "cursors": [None]}
+            st.session_state[pages_key] = pages
+
+        filtered_docs, next_cursor = cached_document_page(member.id, filters, pages["cursors"][-1])
         if not filtered_docs:
             st.info("No documents match the selected filters.")
             return
 
-        adapter = None
+        adapter = get_storage_adapter()
+        # Thumbnails for every card; the large preview and the original only
+        # for documents whose details are expanded.
+        url_keys = []
+        for document in filtered_docs:
+            url_keys += [preview.storage_key for preview in document.previews if preview.kind == "thumbnail"]
+            if st.session_state.get(f"doc_{document.id}_details"):
+                url_keys.append(document.storage_key)
+                url_keys += [preview.storage_key for preview in document.previews if preview.kind == "preview"]
+        download_urls = signed_urls.get_many(adapter, url_keys, 3600) if url_keys else {}
         for document in filtered_docs:
-            if adapter is None:
-                adapter = get_storage_adapter()
-            signed_url = adapter.get_signed_url(document.storage_key, 3600)
             title = f"{document.doc_date} • {document.condition}"
+            previews = {preview.kind: preview.storage_key for preview in document.previews}
             with st.container(border=True):
-                st.markdown(f"**{title}**")
-                st.write(document.file_name)
-                st.caption(f"Uploaded {document.created_at.date()} • File type {document.mime_type}")
+                thumb_col, info_col = st.columns([1, 4])
+                thumbnail_url = download_urls.get(previews.get("thumbnail"))
+                if thumbnail_url:
+                    thumb_col.image(thumbnail_url, use_column_width=True)
+                info_col.markdown(f"**{title}**")
+                info_col.write(document.file_name)
+                info_col.caption(f"Uploaded {document.created_at.date()} • File type {document.mime_type}")
                 if st.checkbox("Show details", key=f"doc_{document.id}_details"):
                     if document.description:
                         st.write(document.description)
+                    preview_url = download_urls.get(previews.get("preview"))
+                    if preview_url:
+                        st.image(preview_url)
+                    signed_url = download_urls.get(document.storage_key)
                     if signed_url:
-                        st.markdown(f"[Download/View]({signed_url})")
+                        st.markdown(f"[Download/View original]({signed_url})")
                     if is_admin():
                         confirm_key = f"confirm_delete_{document.id}"
                         st.checkbox("Confirm delete", key=confirm_key)
@@ -327,20 +494,50 @@ def member_detail():
                                 st.warning("Please confirm deletion before proceeding.")
                             else:
                                 try:
-                                    adapter.delete(document.storage_key)
+                                    pending = delete_documents(adapter, [document.id])
                                 except Exception as exc:
-                                    st.error(f"Failed to delete file from storage: {exc}")
+                                    st.error(f"Failed to delete document: {exc}")
                                     return
-                                with get_db_session() as db:
-                                    record = db.get(Document, document.id)
-                                    if record:
-                                        db.delete(record)
-                                        db.commit()
+                                invalidate_documents(member.id)
+                                if pending:
+                                    st.warning("The file could not be removed from storage yet and will be retried.")
                                 st.success("Document deleted")
                                 st.rerun()
 
+        page_col1, page_col2, page_col3 = st.columns([1, 2, 1])
+        page_col2.caption(f"Page {len(pages['cursors'])}")
+        if len(pages["cursors"]) > 1 and page_col1.button("Newer", key=f"doc_newer_{member.id}"):
+            pages["cursors"].pop()
+            st.rerun()
+        if next_cursor and page_col3.button("Older", key=f"doc_older_{member.id}"):
+            pages["cursors"].append(next_cursor)
+            st.rerun()
 
-def main():
+
+def debug_panel(rerun: RerunStats):
+    with st.sidebar.expander("Rerun timings", expanded=True):
+        st.caption(rerun.log_line())
+        for statement in rerun.n_plus_one:
+            st.warning(f"Possible N+1 query: {statement[:200]}")
+        sections = (("Queries", rerun.statements), ("Storage", rerun.storage_calls), ("Auth", rerun.auth_calls))
+        for title, calls in sections:
+            if calls:
+                st.markdown(f"**{title}**")
+                rows = sorted(calls.items(), key=lambda item: -item[1][1])[:10]
+                st.dataframe(
+                    [
+                        {"calls": count, "ms": round(1000 * seconds, 1), "name": name[:160]}
+                        for name, (count, seconds) in rows
+                    ],
+                    hide_index=True,
+                )
+        latencies = metrics.summary("storage_call_seconds")
+        if latencies:
+            st.markdown("**Storage latency (process)**")
+            st.dataframe(latencies, hide_index=True)
+
+
+def render():
     st.set_page_config(page_title="Family Medical Record App", layout="wide")
 
     if not get_current_user():
@@ -368,6 +565,22 @@ def main():
         format_func=lambda value: labels[value],
         key="page",
     )
+    if is_admin():
+        cache_stats = query_cache.stats()
+        st.sidebar.caption(f"Query cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        db_stats = pool_metrics.snapshot()
+        st.sidebar.caption(
+            f"DB pool: {db_stats['checked_out']} checked out, peak {db_stats['peak_checked_out']}, "
+            f"peak overflow {db_stats['peak_overflow']}"
+        )
+        if JOB_QUEUE_ENABLED:
+            with get_db_session() as db:
+                counts = job_counts(db)
+            st.sidebar.caption(
+                f"Jobs: {counts.get(QUEUED, 0)} queued, {counts.get(RUNNING, 0)} running, "
+                f"{counts.get(FAILED, 0)} failed"
+            )
+        st.sidebar.toggle("Debug panel", key="debug_panel")
 
     if selection == "family_members":
         family_members_tab()
@@ -377,5 +590,12 @@ def main():
         member_detail()
 
 
+def main():
+    with track_rerun() as rerun:
+        render()
+        if is_admin() and st.session_state.get("debug_panel"):
+            debug_panel(rerun)
+
+
 if __name__ == "__main__":
     main()
@@ -1,9 +1,113 @@
-import bcrypt
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
+from instrumentation import record_auth_call
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
 
+# bcrypt releases the GIL, so a small pool hashes in parallel while capping
+# how many cores logins can occupy at once.
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+# bcrypt is imported on first use; most reruns never hash a password.
+def _hash(password: str, rounds: int) -> str:
+    import bcrypt
+
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(password: str, hashed_password: str) -> bool:
+    import bcrypt
 
-def verify_password(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+def _timed(operation: str, future: Future) -> Future:
+    # Timings include time queued for a pool worker, which is what a login waits on.
+    # The callback runs on the pool thread; the copied context attributes it
+    # to the rerun that started it.
+    started = time.perf_counter()
+    context = contextvars.copy_context()
+    future.add_done_callback(lambda _: context.run(record_auth_call, operation, time.perf_counter() - started))
+    return future
+
+
+def hash_password_async(password: str, rounds: int | None = None) -> Future:
+    return _timed("hash_password", _hash_pool.submit(_hash, password, rounds or BCRYPT_ROUNDS))
+
+
+def verify_password_async(password: str, hashed_password: str) -> Future:
+    """Start a check on the hash pool; the caller polls the future instead of blocking its thread."""
+    return _timed("verify_password", _hash_pool.submit(_check, password, hashed_password))
+
+
+def hash_password(password: str, rounds: int | None = None) -> str:
+    return hash_password_async(password, rounds).result()
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return verify_password_async(password, hashed_password).result()
+
+
+def hash_rounds(hashed_password: str) -> int | None:
+    # Modular crypt format: $2b$<cost>$<salt+hash>
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    # Only ever upgrade: lowering BCRYPT_ROUNDS must not weaken stored hashes.
+    rounds = hash_rounds(hashed_password)
+    return rounds is None or rounds < BCRYPT_ROUNDS
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LoginRateLimiter:
+    """Per-account and process-wide token buckets checked before any bcrypt work."""
+
+    def __init__(self, per_account_per_minute: int, global_per_second: int, max_accounts: int = 10000):
+        self.per_account_per_minute = per_account_per_minute
+        self.max_accounts = max_accounts
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_per_second, global_per_second)
+        self._accounts: dict[str, TokenBucket] = {}
+
+    def allow(self, account: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._accounts.get(account)
+            if bucket is None:
+                if len(self._accounts) >= self.max_accounts:
+                    self._accounts.clear()
+                bucket = self._accounts[account] = TokenBucket(
+                    self.per_account_per_minute, self.per_account_per_minute / 60
+                )
+            return bucket.take(now) and self._global.take(now)
+
+
+login_rate_limiter = LoginRateLimiter(
+    per_account_per_minute=int(os.getenv("LOGIN_RATE_PER_ACCOUNT_PER_MINUTE", "5")),
+    global_per_second=int(os.getenv("LOGIN_RATE_GLOBAL_PER_SECOND", str(4 * PASSWORD_HASH_WORKERS))),
+)
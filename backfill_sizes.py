@@ -0,0 +1,69 @@
+"""Record documents.size_bytes for rows stored before uploads recorded it.
+
+Each blob's size comes from the storage backend (a HEAD request on Supabase,
+a stat locally), so nothing is downloaded. Rows are walked in id order and
+updated in batches; blobs that cannot be read are reported and left unknown,
+and re-running the command only visits rows still missing a size.
+
+    python backfill_sizes.py [--workers 8] [--batch-size 500]
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, update
+
+from db import get_db_session
+from models import Document
+from storage import get_storage_adapter
+
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_WORKERS = 8
+
+
+def backfill_sizes(batch_size: int = BACKFILL_BATCH_SIZE, workers: int = BACKFILL_WORKERS) -> dict[str, int]:
+    adapter = get_storage_adapter()
+    report = {"documents": 0, "bytes": 0, "missing": 0}
+
+    def stat(storage_key: str) -> int | None:
+        try:
+            return adapter.size(storage_key)
+        except Exception as exc:
+            print(f"skipping {storage_key}: {exc}")
+            return None
+
+    last_id = None
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="backfill") as pool:
+        while True:
+            with get_db_session() as db:
+                statement = select(Document.id, Document.storage_key).where(Document.size_bytes.is_(None))
+                if last_id is not None:
+                    statement = statement.where(Document.id > last_id)
+                rows = db.execute(statement.order_by(Document.id).limit(batch_size)).all()
+            if not rows:
+                return report
+            last_id = rows[-1].id
+            sizes = list(pool.map(stat, [row.storage_key for row in rows]))
+            updates = [{"id": row.id, "size_bytes": size} for row, size in zip(rows, sizes) if size is not None]
+            report["documents"] += len(updates)
+            report["bytes"] += sum(item["size_bytes"] for item in updates)
+            report["missing"] += len(rows) - len(updates)
+            if updates:
+                with get_db_session() as db:
+                    # A list of primary-keyed parameter sets runs as one executemany.
+                    db.execute(update(Document), updates)
+                    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="concurrent size lookups")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    report = backfill_sizes(args.batch_size, args.workers)
+    print(f"recorded sizes for {report['documents']} documents ({report['bytes']} bytes), {report['missing']} missing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Login throughput of auth.verify_password under concurrent sessions.
+
+Each simulated session verifies a password on its own thread, as Streamlit
+script threads do, and the result is reported as logins per second per core.
+
+    python -m benchmarks.bcrypt_logins --sessions 16 --logins 64 --rounds 12
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import auth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS)
+    args = parser.parse_args()
+
+    hashed = auth.hash_password("correct horse battery staple", rounds=args.rounds)
+
+    started = time.perf_counter()
+    for _ in range(max(1, args.logins // 8)):
+        auth._check("correct horse battery staple", hashed)
+    serial_rate = max(1, args.logins // 8) / (time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=args.sessions) as sessions:
+        started = time.perf_counter()
+        results = list(
+            sessions.map(lambda _: auth.verify_password("correct horse battery staple", hashed), range(args.logins))
+        )
+        elapsed = time.perf_counter() - started
+    assert all(results)
+
+    cores = min(auth.PASSWORD_HASH_WORKERS, os.cpu_count() or 1)
+    rate = args.logins / elapsed
+    print(f"cost factor {args.rounds}, {auth.PASSWORD_HASH_WORKERS} hash workers, {args.sessions} sessions")
+    print(f"single thread      {serial_rate:8.2f} logins/s")
+    print(f"worker pool        {rate:8.2f} logins/s  ({rate / cores:.2f} logins/s per core over {cores} cores)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""In-process stand-in for the Supabase Storage HTTP API used by SupabaseStorageAdapter.
+
+Covers object upload, TUS resumable upload, signing, download, copy and
+removal.
+
+Only object sizes are kept, and downloads return zero bytes of the stored
+length, so the server's own memory stays flat across large runs. An optional
+per-request delay simulates network round trips.
+"""
+
+import base64
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+PREFIX = "/storage/v1/"
+
+
+class FakeStorageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    objects: dict[str, int]
+    resumable: dict[str, dict]
+    latency_seconds: float = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _path(self) -> str:
+        path = unquote(urlsplit(self.path).path)
+        return path[len(PREFIX) :] if path.startswith(PREFIX) else path.lstrip("/")
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _drain_body(self) -> int:
+        """Consume an upload body without keeping it, returning its size."""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            return len(self._read_body())
+        remaining = int(self.headers.get("Content-Length") or 0)
+        size = remaining
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        return size
+
+    def _send(self, status: int, payload=None, body=None, content_type="application/json", headers=None):
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+        body = body or b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _delay(self):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _tus_create(self):
+        metadata = {}
+        for item in self.headers.get("Upload-Metadata", "").split(","):
+            if item.strip():
+                key, _, value = item.strip().partition(" ")
+                metadata[key] = base64.b64decode(value).decode("utf-8")
+        upload_id = uuid.uuid4().hex
+        self.resumable[upload_id] = {
+            "object": f"{metadata['bucketName']}/{metadata['objectName']}",
+            "length": int(self.headers["Upload-Length"]),
+            "offset": 0,
+        }
+        host, port = self.server.server_address[:2]
+        location = f"http://{host}:{port}{PREFIX}upload/resumable/{upload_id}"
+        self._send(201, headers={"Location": location, "Tus-Resumable": "1.0.0"})
+
+    def do_PATCH(self):
+        self._delay()
+        upload = self.resumable.get(self._path().removeprefix("upload/resumable/"))
+        if upload is None:
+            self._drain_body()
+            self._send(404)
+            return
+        if int(self.headers.get("Upload-Offset", -1)) != upload["offset"]:
+            self._drain_body()
+            self._send(409)
+            return
+        upload["offset"] += self._drain_body()
+        if upload["offset"] >= upload["length"]:
+            self.objects[upload["object"]] = upload["length"]
+        self._send(204, headers={"Upload-Offset": str(upload["offset"]), "Tus-Resumable": "1.0.0"})
+
+    def do_POST(self):
+        self._delay()
+        path = self._path()
+        if path == "upload/resumable":
+            self._tus_create()
+        elif path.startswith("object/sign/"):
+            rest = path[len("object/sign/") :]
+            payload = json.loads(self._read_body() or b"{}")
+            if "/" not in rest:
+                self._send(
+                    200,
+                    [
+                        {"path": key, "signedURL": f"/object/sign/{rest}/{key}?token=fake", "error": None}
+                        for key in payload.get("paths", [])
+                    ],
+                )
+            else:
+                self._send(200, {"signedURL": f"/object/sign/{rest}?token=fake"})
+        elif path == "object/copy":
+            payload = json.loads(self._read_body() or b"{}")
+            bucket = payload.get("bucketId")
+            self.objects[f"{bucket}/{payload['destinationKey']}"] = self.objects.get(
+                f"{bucket}/{payload['sourceKey']}", 0
+            )
+            self._send(200, {"Key": f"{bucket}/{payload['destinationKey']}"})
+        elif path.startswith("object/"):
+            self.objects[path[len("object/") :]] = self._drain_body()
+            self._send(200, {"Key": path[len("object/") :]})
+        else:
+            self._read_body()
+            self._send(404, {"error": "not found"})
+
+    def do_HEAD(self):
+        self._delay()
+        if self._path().startswith("upload/resumable/"):
+            upload = self.resumable.get(self._path().removeprefix("upload/resumable/"))
+            if upload is None:
+                self._send(404)
+            else:
+                headers = {"Upload-Offset": str(upload["offset"]), "Upload-Length": str(upload["length"])}
+                self._send(200, headers={**headers, "Cache-Control": "no-store"})
+            return
+        key = self._path().removeprefix("object/authenticated/")
+        if key not in self.objects:
+            self._send(404)
+            return
+        # _send advertises the body's length and skips writing it for HEAD.
+        self._send(200, body=bytes(self.objects[key]), content_type="application/octet-stream")
+
+    def do_GET(self):
+        self._delay()
+        key = self._path().removeprefix("object/authenticated/")
+        if key not in self.objects:
+            self._send(404, {"error": "not found"})
+            return
+        self._send(200, body=bytes(self.objects[key]), content_type="application/octet-stream")
+
+    def do_DELETE(self):
+        self._delay()
+        bucket = self._path().removeprefix("object/")
+        prefixes = json.loads(self._read_body() or b"{}").get("prefixes", [])
+        removed = [{"name": key} for key in prefixes if self.objects.pop(f"{bucket}/{key}", None) is not None]
+        self._send(200, removed)
+
+
+def start_fake_storage(latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    handler = type(
+        "ConfiguredFakeStorageHandler",
+        (FakeStorageHandler,),
+        {"objects": {}, "resumable": {}, "latency_seconds": latency_ms / 1000},
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-storage", daemon=True).start()
+    return server
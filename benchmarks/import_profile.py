@@ -0,0 +1,86 @@
+"""Cold-start import cost of app.py, measured with python -X importtime.
+
+app.py is imported in a fresh interpreter against a throwaway SQLite
+database and local storage, so the numbers cover module import plus the
+one-time health check and schema bootstrap, without Streamlit serving.
+
+    python -m benchmarks.import_profile --top 15 --output import_profile.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_imports(module: str = "app") -> tuple[float, list[dict]]:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "STORAGE_BACKEND": "local",
+            "LOCAL_STORAGE_PATH": os.path.join(workdir, "uploads"),
+            "PYTHONPATH": REPO_ROOT,
+        }
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        wall_seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(result.stderr[-2000:])
+
+    # import time: self [us] | cumulative | imported package
+    packages = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        packages.append(
+            {
+                "package": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return wall_seconds, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    wall_seconds, packages = profile_imports(args.module)
+    top_level = [package for package in packages if package["depth"] == 0]
+    imported_ms = sum(package["cumulative_ms"] for package in top_level)
+
+    print(f"import {args.module}: {wall_seconds * 1000:.0f} ms wall, {imported_ms:.0f} ms in imports")
+    # Direct imports of the top-level modules: app's own dependencies, site hooks.
+    direct = [package for package in packages if package["depth"] == 1]
+    for package in sorted(direct, key=lambda package: package["cumulative_ms"], reverse=True)[: args.top]:
+        print(f"  {package['cumulative_ms']:9.1f} ms  {package['package']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(
+                {"module": args.module, "wall_ms": wall_seconds * 1000, "import_ms": imported_ms, "packages": packages},
+                handle,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
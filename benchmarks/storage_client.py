@@ -0,0 +1,90 @@
+"""Per-call latency of Supabase storage calls against a local stub server.
+
+Compares building a fresh client for every call (the previous behaviour)
+with the shared, pooled client from ``storage.supabase_clients``.
+
+    python -m benchmarks.storage_client --calls 200
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from supabase import create_client
+
+from storage import SupabaseStorageAdapter, supabase_clients
+
+FAKE_KEY = "stub.stub.stub"
+BUCKET = "bench"
+
+
+class StubStorageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        body = json.dumps({"signedURL": f"/object/sign/{BUCKET}/doc?token=stub"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubStorageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_calls(call, calls: int) -> list[float]:
+    call()
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(samples):7.3f} ms  p50 {statistics.median(samples):7.3f} ms  p95 {p95:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def fresh_client_call():
+        client = create_client(url, FAKE_KEY)
+        client.storage.from_(BUCKET).create_signed_url("doc", 3600)
+
+    adapter = SupabaseStorageAdapter(url=url, anon_key=FAKE_KEY, bucket=BUCKET)
+
+    def pooled_client_call():
+        adapter.get_signed_url("doc", 3600)
+
+    try:
+        report("fresh client per call", time_calls(fresh_client_call, args.calls))
+        report("pooled shared client", time_calls(pooled_client_call, args.calls))
+    finally:
+        supabase_clients.clear()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
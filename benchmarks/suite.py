@@ -0,0 +1,353 @@
+"""End-to-end benchmark of the app's data paths against synthetic families.
+
+Seeds a database (a temporary SQLite file by default, or --database-url),
+starts a fake Supabase Storage server, then measures:
+
+- Streamlit reruns through AppTest: p50/p95 latency and queries per rerun
+  for the family list and member documents pages, with a warm and a cold
+  query cache;
+- queries.list_documents / document_facets called directly;
+- upload throughput through uploads.upload_files, and batch URL signing;
+- the process memory high-water mark after each phase.
+
+Results are printed and, with --output, written as JSON. --compare takes an
+earlier JSON file and prints the change per metric.
+
+    python -m benchmarks.suite --members 1000 --documents 500000 --output bench.json
+    python -m benchmarks.suite --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from benchmarks.fake_storage import start_fake_storage
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+BUCKET = "bench"
+CONDITIONS = [
+    "annual checkup", "asthma", "allergy", "blood work", "cardiology", "dental", "dermatology", "flu",
+    "fracture", "immunization", "ophthalmology", "orthopedics", "pediatrics", "physical therapy", "radiology",
+]  # fmt: skip
+MIME_TYPES = [("application/pdf", "pdf"), ("image/jpeg", "jpg"), ("image/png", "png")]
+SEED_CHUNK = 5000
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[max(0, int(len(ordered) * 0.95) - 1)], 3),
+        "mean_ms": round(statistics.mean(ordered), 3),
+    }
+
+
+def max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def metric_count(name: str) -> int:
+    from instrumentation import metrics
+
+    return sum(entry["count"] for entry in metrics.summary(name))
+
+
+def seed(engine, members: int, documents: int, preview_ratio: float, rng: random.Random) -> dict:
+    from sqlalchemy import insert
+
+    from auth import hash_password
+    from models import Document, DocumentPreview, FamilyMember, User
+
+    started = time.perf_counter()
+    admin_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(User),
+            [
+                {
+                    "id": admin_id,
+                    "email": "bench@example.com",
+                    "password_hash": hash_password("bench", 4),
+                    "role": "admin",
+                }
+            ],
+        )
+        member_ids = [uuid.uuid4() for _ in range(members)]
+        connection.execute(
+            insert(FamilyMember),
+            [
+                {
+                    "id": member_id,
+                    "full_name": f"Member {index:05d}",
+                    "dob": date(1950, 1, 1) + timedelta(days=rng.randrange(365 * 70)),
+                    "created_by": admin_id,
+                    "created_at": now - timedelta(days=2000 - index % 2000),
+                }
+                for index, member_id in enumerate(member_ids)
+            ],
+        )
+
+    for start in range(0, documents, SEED_CHUNK):
+        document_rows, preview_rows = [], []
+        for index in range(start, min(start + SEED_CHUNK, documents)):
+            document_id = uuid.uuid4()
+            mime_type, extension = rng.choice(MIME_TYPES)
+            document_rows.append(
+                {
+                    "id": document_id,
+                    "member_id": member_ids[index % members],
+                    "uploaded_by": admin_id,
+                    "doc_date": date.today() - timedelta(days=rng.randrange(3650)),
+                    "condition": rng.choice(CONDITIONS),
+                    "description": f"visit notes {index}" if rng.random() < 0.3 else None,
+                    "storage_key": f"uploads/{document_id}/record_{index}.{extension}",
+                    "file_name": f"record_{index}.{extension}",
+                    "mime_type": mime_type,
+                    "size_bytes": rng.randrange(20_000, 5_000_000),
+                    "created_at": now - timedelta(seconds=rng.randrange(5 * 365 * 86400)),
+                }
+            )
+            if rng.random() < preview_ratio:
+                preview_rows.append(
+                    {
+                        "id": uuid.uuid4(),
+                        "document_id": document_id,
+                        "kind": "thumbnail",
+                        "storage_key": f"uploads/{document_id}/record_{index}.thumbnail.jpg",
+                        "mime_type": "image/jpeg",
+                        "width": 320,
+                        "height": 240,
+                    }
+                )
+        with engine.begin() as connection:
+            connection.execute(insert(Document), document_rows)
+            if preview_rows:
+                connection.execute(insert(DocumentPreview), preview_rows)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "members": members,
+        "documents": documents,
+        "seconds": round(elapsed, 2),
+        "documents_per_s": round(documents / elapsed, 1) if elapsed else 0.0,
+        "admin_id": str(admin_id),
+        "member_ids": [str(member_id) for member_id in member_ids],
+    }
+
+
+def bench_reruns(admin_id: str, member_ids: list[str], reruns: int, rng: random.Random) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    from cache import query_cache
+    from identity import SESSION_KEY, principal_for
+
+    results = {}
+    scenarios = [
+        ("family_members.warm", "family_members", False, False),
+        ("member_documents.warm", "member_documents", False, False),
+        ("member_documents.cold", "member_documents", True, True),
+    ]
+    for label, page, cold_cache, random_member in scenarios:
+        app = AppTest.from_file(APP_PATH, default_timeout=120)
+        app.session_state[SESSION_KEY] = principal_for(admin_id, "bench@example.com", "admin")
+        app.session_state["page"] = page
+        app.session_state["member_id"] = uuid.UUID(member_ids[0])
+        app.run()
+        if app.exception:
+            raise RuntimeError(f"{label}: {app.exception[0].message}")
+        samples, queries, storage_calls = [], [], []
+        for _ in range(reruns):
+            if cold_cache:
+                query_cache.clear()
+            if random_member:
+                app.session_state["member_id"] = uuid.UUID(rng.choice(member_ids))
+            query_count, storage_count = metric_count("db_query_seconds"), metric_count("storage_call_seconds")
+            started = time.perf_counter()
+            app.run()
+            samples.append((time.perf_counter() - started) * 1000)
+            queries.append(metric_count("db_query_seconds") - query_count)
+            storage_calls.append(metric_count("storage_call_seconds") - storage_count)
+        results[label] = {
+            **percentiles(samples),
+            "queries_per_rerun": round(statistics.mean(queries), 2),
+            "storage_calls_per_rerun": round(statistics.mean(storage_calls), 2),
+        }
+    results["max_rss_mb"] = max_rss_mb()
+    return results
+
+
+def bench_queries(engine, member_ids: list[str], iterations: int, rng: random.Random) -> dict:
+    from db import get_db_session
+    from queries import DocumentFilters, document_facets, list_documents, member_stats
+
+    cases = {
+        "list_documents.first_page": lambda db, member_id: list_documents(db, member_id, DocumentFilters()),
+        "list_documents.search": lambda db, member_id: list_documents(
+            db, member_id, DocumentFilters(search_text=rng.choice(CONDITIONS)[:5])
+        ),
+        "list_documents.condition": lambda db, member_id: list_documents(
+            db, member_id, DocumentFilters(condition=rng.choice(CONDITIONS))
+        ),
+        "document_facets": document_facets,
+        "member_stats": lambda db, member_id: member_stats(db),
+    }
+    results = {}
+    for label, case in cases.items():
+        samples = []
+        for _ in range(iterations):
+            member_id = uuid.UUID(rng.choice(member_ids))
+            with get_db_session() as db:
+                started = time.perf_counter()
+                case(db, member_id)
+                samples.append((time.perf_counter() - started) * 1000)
+        results[label] = percentiles(samples)
+    results["max_rss_mb"] = max_rss_mb()
+    return results
+
+
+def bench_storage(uploads: int, upload_size: int, sign_batches: int) -> dict:
+    from storage import get_storage_adapter
+    from uploads import PendingUpload, upload_files
+
+    adapter = get_storage_adapter()
+    payload = os.urandom(upload_size)
+    pending = [PendingUpload(payload, f"bench_{index}.pdf", "application/pdf") for index in range(uploads)]
+    started = time.perf_counter()
+    storage_keys = upload_files(adapter, pending)
+    elapsed = time.perf_counter() - started
+
+    samples = []
+    for _ in range(sign_batches):
+        started_sign = time.perf_counter()
+        adapter.get_signed_urls(storage_keys[:25], 3600)
+        samples.append((time.perf_counter() - started_sign) * 1000)
+    return {
+        "upload": {
+            "files": uploads,
+            "mb": round(uploads * upload_size / 1_000_000, 2),
+            "mb_per_s": round(uploads * upload_size / 1_000_000 / elapsed, 2),
+            "files_per_s": round(uploads / elapsed, 1),
+        },
+        "sign_25_urls": percentiles(samples),
+        "max_rss_mb": max_rss_mb(),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(previous: dict, current: dict) -> None:
+    before, after = flatten(previous["results"]), flatten(current["results"])
+    print(f"\nchange since {previous.get('commit') or 'previous run'}:")
+    for key in sorted(set(before) & set(after)):
+        if before[key] and (key.endswith("_ms") or key.endswith("_per_s") or key.endswith("per_rerun")):
+            change = 100 * (after[key] - before[key]) / before[key]
+            print(f"  {key:<54} {before[key]:>10} -> {after[key]:>10}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite database")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded --database-url")
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--preview-ratio", type=float, default=0.5)
+    parser.add_argument("--reruns", type=int, default=30)
+    parser.add_argument("--query-iterations", type=int, default=200)
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--upload-size", type=int, default=1024 * 1024, help="bytes per uploaded file")
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0, help="simulated round trip per request")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to diff against")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.TemporaryDirectory()
+    server = start_fake_storage(args.storage_latency_ms)
+    # Configuration is read at import time, so it is set before any app module loads.
+    os.environ.update(
+        {
+            "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir.name, 'bench.db')}",
+            "STORAGE_BACKEND": "supabase",
+            "STORAGE_CONTENT_ADDRESSED": "false",
+            "SUPABASE_URL": f"http://127.0.0.1:{server.server_address[1]}",
+            "SUPABASE_SERVICE_ROLE_KEY": "bench.bench.bench",
+            "SUPABASE_BUCKET": BUCKET,
+            "INSTRUMENTATION_ENABLED": "true",
+            "METRICS_PORT": "",
+        }
+    )
+    sys.path.insert(0, REPO_ROOT)
+    from sqlalchemy import select
+
+    from db import engine, get_db_session
+    from models import FamilyMember, User
+    from schema import ensure_schema
+
+    ensure_schema(engine)
+    if args.skip_seed:
+        with get_db_session() as db:
+            admin_id = str(db.execute(select(User.id).where(User.role == "admin")).scalars().first())
+            member_ids = [str(member_id) for member_id in db.execute(select(FamilyMember.id)).scalars()]
+        seeded = {"members": len(member_ids), "reused": True}
+    else:
+        seeded = seed(engine, args.members, args.documents, args.preview_ratio, rng)
+        admin_id, member_ids = seeded.pop("admin_id"), seeded.pop("member_ids")
+        print(f"seeded {args.members} members, {args.documents} documents in {seeded['seconds']}s")
+
+    results = {"seed": {**seeded, "max_rss_mb": max_rss_mb()}}
+    results["queries"] = bench_queries(engine, member_ids, args.query_iterations, rng)
+    results["reruns"] = bench_reruns(admin_id, member_ids, args.reruns, rng)
+    results["storage"] = bench_storage(args.uploads, args.upload_size, args.reruns)
+    server.shutdown()
+    workdir.cleanup()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in {"output", "compare"}},
+        "database": engine.dialect.name,
+        "results": results,
+    }
+    for key, value in flatten(results).items():
+        print(f"{key:<54} {value}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            compare(json.load(handle), report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
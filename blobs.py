@@ -0,0 +1,117 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select, update
+
+from db import get_db_session
+from models import Document, DocumentPreview, PendingBlobDeletion
+from storage import StorageAdapter, is_content_key, signed_urls
+
+logger = logging.getLogger(__name__)
+
+BLOB_DELETION_BATCH_SIZE = int(os.getenv("BLOB_DELETION_BATCH_SIZE", "1000"))
+BLOB_DELETION_RETRY_SECONDS = 60
+# Content-addressed keys are shared: an upload may have found the key present
+# and not yet committed the row referencing it. Such keys stay queued for this
+# long after they were last released or reused.
+BLOB_DELETION_GRACE_SECONDS = int(os.getenv("BLOB_DELETION_GRACE_SECONDS", "300"))
+
+
+def referenced_keys(db, storage_keys: list[str]) -> set[str]:
+    referenced = set()
+    for column in (Document.storage_key, Document.original_storage_key, DocumentPreview.storage_key):
+        referenced.update(db.execute(select(column).where(column.in_(storage_keys)).distinct()).scalars())
+    return referenced
+
+
+def enqueue_blob_deletions(db, storage_keys: list[str]) -> None:
+    """Record keys for deletion inside the caller's transaction, so removing rows
+    and scheduling their blobs' cleanup commit or roll back together."""
+    now = datetime.now(timezone.utc)
+    grace = timedelta(seconds=BLOB_DELETION_GRACE_SECONDS)
+    db.add_all(
+        PendingBlobDeletion(storage_key=storage_key, next_attempt_at=now + grace if is_content_key(storage_key) else now)
+        for storage_key in dict.fromkeys(storage_keys)
+    )
+
+
+def defer_blob_deletion(storage_key: str) -> None:
+    """Restart the grace period of a queued key an upload is about to reuse.
+
+    Called before the upload checks that the key exists, so the key cannot
+    become due again before the referencing row commits.
+    """
+    with get_db_session() as db:
+        db.execute(
+            update(PendingBlobDeletion)
+            .where(PendingBlobDeletion.storage_key == storage_key)
+            .values(next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=BLOB_DELETION_GRACE_SECONDS))
+        )
+        db.commit()
+
+
+def has_due_blob_deletions() -> bool:
+    with get_db_session() as db:
+        return db.execute(
+            select(PendingBlobDeletion.storage_key)
+            .where(PendingBlobDeletion.next_attempt_at <= datetime.now(timezone.utc))
+            .limit(1)
+        ).first() is not None
+
+
+def process_blob_deletions(
+    adapter: StorageAdapter,
+    storage_keys: list[str] | None = None,
+    limit: int = BLOB_DELETION_BATCH_SIZE,
+) -> tuple[list[str], list[str]]:
+    """Delete queued blobs that nothing references any more.
+
+    With content-addressed storage a key can be shared, so keys still used by
+    a document or preview are dropped from the queue without deleting bytes,
+    and content keys only become due once their grace period has passed.
+    Failed keys stay queued with exponential backoff. Returns (deleted, failed).
+    """
+    now = datetime.now(timezone.utc)
+    with get_db_session() as db:
+        statement = select(PendingBlobDeletion.storage_key).where(PendingBlobDeletion.next_attempt_at <= now)
+        if storage_keys is not None:
+            statement = statement.where(PendingBlobDeletion.storage_key.in_(storage_keys))
+        queued = list(dict.fromkeys(db.execute(statement.limit(limit)).scalars()))
+        if not queued:
+            return [], []
+        referenced = referenced_keys(db, queued)
+
+    to_delete = [storage_key for storage_key in queued if storage_key not in referenced]
+    failed = adapter.delete_many(to_delete) if to_delete else []
+    done = [storage_key for storage_key in queued if storage_key not in set(failed)]
+
+    with get_db_session() as db:
+        if done:
+            db.execute(delete(PendingBlobDeletion).where(PendingBlobDeletion.storage_key.in_(done)))
+        for entry in db.execute(
+            select(PendingBlobDeletion).where(PendingBlobDeletion.storage_key.in_(failed))
+        ).scalars():
+            entry.attempts += 1
+            entry.last_error = "storage delete failed"
+            entry.next_attempt_at = now + timedelta(seconds=BLOB_DELETION_RETRY_SECONDS * 2 ** min(entry.attempts, 10))
+        db.commit()
+
+    deleted = [storage_key for storage_key in to_delete if storage_key not in set(failed)]
+    for storage_key in deleted:
+        signed_urls.invalidate(adapter, storage_key)
+    if failed:
+        logger.warning("Queued %s blob deletion(s) for retry", len(failed))
+    return deleted, failed
+
+
+def release_blobs(adapter: StorageAdapter, storage_keys: list[str]) -> list[str]:
+    """Queue and immediately attempt deletion of blobs whose rows are already gone."""
+    storage_keys = list(dict.fromkeys(storage_keys))
+    if not storage_keys:
+        return []
+    with get_db_session() as db:
+        enqueue_blob_deletions(db, storage_keys)
+        db.commit()
+    deleted, _ = process_blob_deletions(adapter, storage_keys)
+    return deleted
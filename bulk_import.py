@@ -0,0 +1,449 @@
+"""Bulk-import an archive of existing records from a directory tree or ZIP file.
+
+The first folder under the root names the family member (matched on full
+name); every PDF or image below it becomes a Document. doc_date, condition
+and description come from a CSV manifest when one is given, otherwise from
+the filename pattern, e.g.
+
+    <root>/Jane Doe/2019/2019-03-14_annual checkup.pdf
+
+Files upload concurrently through the configured StorageAdapter, rows are
+inserted in batched executemany transactions, and each committed batch is
+appended to a checkpoint file, so re-running the same command resumes an
+interrupted import. Every finished upload is first journaled next to the
+checkpoint; a resumed run checkpoints journaled files whose row did commit
+and releases the blobs of those that never got one.
+
+    python bulk_import.py ARCHIVE --uploaded-by admin@example.com [--manifest records.csv]
+
+Manifest columns: path (relative to the root), member, doc_date (YYYY-MM-DD),
+condition, description. Only path is required; blank cells fall back to the
+folder and filename.
+"""
+
+import argparse
+import csv
+import mimetypes
+import os
+import re
+import time
+import uuid
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import insert, select
+
+from db import check_database, engine, get_db_session
+from models import Document, FamilyMember
+from previews import generate_previews
+from queries import user_by_email
+from schema import ensure_schema
+from storage import StorageAdapter, get_storage_adapter
+from uploads import delete_blobs
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "8"))
+ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg"}
+FILENAME_PATTERN = r"(?P<date>\d{4}-\d{2}-\d{2})[ _-]*(?P<condition>.*)"
+
+
+class DirectorySource:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def files(self):
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+            for filename in sorted(filenames):
+                full_path = os.path.join(directory, filename)
+                stat = os.stat(full_path)
+                relative = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                yield relative, stat.st_size, date.fromtimestamp(stat.st_mtime)
+
+    def open(self, path: str):
+        return open(os.path.join(self.root, path), "rb")
+
+    def close(self) -> None:
+        pass
+
+
+class ZipSource:
+    def __init__(self, archive_path: str):
+        # ZipFile serializes reads of the shared handle, so worker threads can
+        # stream different members at once.
+        self.archive = zipfile.ZipFile(archive_path)
+
+    def files(self):
+        for info in sorted(self.archive.infolist(), key=lambda info: info.filename):
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            yield info.filename, info.file_size, date(*info.date_time[:3])
+
+    def open(self, path: str):
+        return self.archive.open(path)
+
+    def close(self) -> None:
+        self.archive.close()
+
+
+@dataclass
+class ImportEntry:
+    path: str
+    member: str
+    doc_date: date
+    condition: str
+    description: str | None
+    size: int
+
+
+@dataclass
+class ImportReport:
+    planned: int = 0
+    imported: int = 0
+    bytes: int = 0
+    already_imported: int = 0
+    failed: list[tuple[str, str]] = field(default_factory=list)
+    skipped: list[tuple[str, str]] = field(default_factory=list)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def rates(self) -> tuple[float, float]:
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        return self.imported / elapsed, self.bytes / 1_000_000 / elapsed
+
+
+def read_manifest(manifest_path: str) -> dict[str, dict[str, str]]:
+    with open(manifest_path, newline="", encoding="utf-8-sig") as handle:
+        return {row["path"].strip().removeprefix("./"): row for row in csv.DictReader(handle)}
+
+
+def read_checkpoint(checkpoint_path: str) -> set[str]:
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, encoding="utf-8") as handle:
+        return {line.rstrip("\n") for line in handle if line.strip()}
+
+
+def append_checkpoint(checkpoint_path: str, paths: list[str]) -> None:
+    with open(checkpoint_path, "a", encoding="utf-8") as handle:
+        handle.writelines(f"{path}\n" for path in paths)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+class UploadJournal:
+    """Append-only "path<TAB>document id<TAB>storage key" log of finished uploads."""
+
+    def __init__(self, journal_path: str):
+        self.path = journal_path
+        self._lock = threading.Lock()
+        self._handle = open(journal_path, "a", encoding="utf-8")
+
+    def record(self, path: str, document_id: uuid.UUID, storage_key: str) -> None:
+        # Flushed per line so a killed process still leaves it behind; synced
+        # with each checkpoint append.
+        with self._lock:
+            self._handle.write(f"{path}\t{document_id}\t{storage_key}\n")
+            self._handle.flush()
+
+    def sync(self) -> None:
+        with self._lock:
+            os.fsync(self._handle.fileno())
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+def recover_uploads(adapter: StorageAdapter, checkpoint_path: str, journal_path: str) -> None:
+    """Settle uploads an interrupted run journaled but never checkpointed."""
+    if not os.path.exists(journal_path):
+        return
+    done = read_checkpoint(checkpoint_path)
+    journaled = {}
+    with open(journal_path, encoding="utf-8") as handle:
+        for line in handle:
+            parts = line.rstrip("\n").split("\t")
+            # A torn final line from a kill mid-write is skipped.
+            if len(parts) == 3 and parts[0] not in done:
+                journaled[uuid.UUID(parts[1])] = (parts[0], parts[2])
+    if journaled:
+        with get_db_session() as db:
+            inserted = set(db.execute(select(Document.id).where(Document.id.in_(list(journaled)))).scalars())
+        if inserted:
+            # The batch committed but the run died before its checkpoint append.
+            append_checkpoint(checkpoint_path, [journaled[document_id][0] for document_id in inserted])
+        orphaned = [key for document_id, (_, key) in journaled.items() if document_id not in inserted]
+        if orphaned:
+            print(f"releasing {len(orphaned)} blobs uploaded by an interrupted run")
+            delete_blobs(adapter, orphaned)
+    os.remove(journal_path)
+
+
+def plan_import(
+    source,
+    manifest: dict[str, dict[str, str]],
+    pattern: re.Pattern,
+    default_condition: str | None,
+    report: ImportReport,
+) -> list[ImportEntry]:
+    entries = []
+    for path, size, modified in source.files():
+        name = os.path.basename(path)
+        stem, extension = os.path.splitext(name)
+        if name.startswith(".") or extension.lower() not in ALLOWED_EXTENSIONS:
+            continue
+        row = manifest.get(path, {})
+        match = pattern.search(stem)
+        parsed = match.groupdict() if match else {}
+
+        member = (row.get("member") or "").strip() or (path.split("/")[0] if "/" in path else "")
+        if not member:
+            report.skipped.append((path, "no member folder"))
+            continue
+        try:
+            raw_date = (row.get("doc_date") or "").strip() or parsed.get("date")
+            doc_date = date.fromisoformat(raw_date) if raw_date else modified
+        except ValueError:
+            report.skipped.append((path, f"invalid date {raw_date!r}"))
+            continue
+        condition = (row.get("condition") or "").strip()
+        condition = condition or (parsed.get("condition") or "").replace("_", " ").strip() or default_condition
+        if not condition:
+            report.skipped.append((path, "no condition"))
+            continue
+        entries.append(
+            ImportEntry(path, member, doc_date, condition, (row.get("description") or "").strip() or None, size)
+        )
+    return entries
+
+
+def resolve_members(entries: list[ImportEntry], uploader_id, create_members: bool, report: ImportReport) -> dict:
+    with get_db_session() as db:
+        rows = db.execute(select(FamilyMember.id, FamilyMember.full_name))
+        members = {name.casefold(): member_id for member_id, name in rows}
+        missing = sorted({entry.member for entry in entries if entry.member.casefold() not in members})
+        if missing and create_members:
+            for name in missing:
+                member_id = uuid.uuid4()
+                db.add(FamilyMember(id=member_id, full_name=name, created_by=uploader_id))
+                members[name.casefold()] = member_id
+            db.commit()
+        elif missing:
+            report.skipped.extend((name, "unknown member (use --create-members)") for name in missing)
+    return members
+
+
+def _upload(
+    adapter: StorageAdapter, source, journal: UploadJournal, document_id: uuid.UUID, entry: ImportEntry
+) -> tuple[str | None, str | None]:
+    content_type = mimetypes.guess_type(entry.path)[0] or "application/octet-stream"
+    try:
+        with source.open(entry.path) as file:
+            storage_key = adapter.upload(file, os.path.basename(entry.path), content_type)
+    except Exception as exc:
+        return None, str(exc)
+    journal.record(entry.path, document_id, storage_key)
+    return storage_key, None
+
+
+def _preview(adapter: StorageAdapter, source, document_id, entry: ImportEntry) -> None:
+    content_type = mimetypes.guess_type(entry.path)[0] or "application/octet-stream"
+    try:
+        with source.open(entry.path) as file:
+            generate_previews(adapter, document_id, file, os.path.basename(entry.path), content_type)
+    except Exception as exc:
+        print(f"preview failed for {entry.path}: {exc}")
+
+
+def _insert_batch(adapter: StorageAdapter, rows: list[dict]) -> None:
+    try:
+        with get_db_session() as db:
+            # A list of parameter sets runs as a single executemany.
+            db.execute(insert(Document), rows)
+            db.commit()
+    except BaseException:
+        delete_blobs(adapter, [row["storage_key"] for row in rows])
+        raise
+
+
+def run_import(
+    adapter: StorageAdapter,
+    source,
+    entries: list[ImportEntry],
+    members: dict,
+    uploader_id,
+    checkpoint_path: str,
+    report: ImportReport,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    workers: int = IMPORT_WORKERS,
+    previews: bool = False,
+) -> ImportReport:
+    journal_path = f"{checkpoint_path}.uploads"
+    recover_uploads(adapter, checkpoint_path, journal_path)
+    done = read_checkpoint(checkpoint_path)
+    pending = [entry for entry in entries if entry.path not in done and entry.member.casefold() in members]
+    report.already_imported = sum(1 for entry in entries if entry.path in done)
+    report.planned = len(pending)
+
+    journal = UploadJournal(journal_path)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="import") as pool:
+        # A bounded window keeps every worker busy across batch boundaries
+        # while this thread inserts and checkpoints completed batches in
+        # order, and leaves little to cancel if the import stops.
+        in_flight: deque = deque()
+        remaining = iter(pending)
+        batch: list[tuple[ImportEntry, dict]] = []
+        preview_futures = []
+
+        def submit_next() -> None:
+            entry = next(remaining, None)
+            if entry is not None:
+                document_id = uuid.uuid4()
+                future = pool.submit(_upload, adapter, source, journal, document_id, entry)
+                in_flight.append((entry, document_id, future))
+
+        def flush():
+            if not batch:
+                return
+            flushed = batch[:]
+            # _insert_batch releases these blobs itself if the insert fails.
+            batch.clear()
+            _insert_batch(adapter, [row for _, row in flushed])
+            journal.sync()
+            append_checkpoint(checkpoint_path, [entry.path for entry, _ in flushed])
+            report.imported += len(flushed)
+            report.bytes += sum(entry.size for entry, _ in flushed)
+            if previews:
+                preview_futures.extend(
+                    pool.submit(_preview, adapter, source, row["id"], entry) for entry, row in flushed
+                )
+            files_per_second, mb_per_second = report.rates()
+            print(
+                f"{report.imported}/{report.planned} files, "
+                f"{files_per_second:.1f} files/s, {mb_per_second:.2f} MB/s"
+            )
+
+        for _ in range(2 * max(1, workers)):
+            submit_next()
+        try:
+            while in_flight:
+                entry, document_id, future = in_flight.popleft()
+                submit_next()
+                storage_key, error = future.result()
+                if error is not None:
+                    report.failed.append((entry.path, error))
+                    continue
+                batch.append(
+                    (
+                        entry,
+                        {
+                            "id": document_id,
+                            "member_id": members[entry.member.casefold()],
+                            "uploaded_by": uploader_id,
+                            "doc_date": entry.doc_date,
+                            "condition": entry.condition,
+                            "description": entry.description,
+                            "storage_key": storage_key,
+                            "file_name": os.path.basename(entry.path),
+                            "mime_type": mimetypes.guess_type(entry.path)[0] or "application/octet-stream",
+                            "size_bytes": entry.size,
+                        },
+                    )
+                )
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+            for future in preview_futures:
+                future.result()
+        except BaseException:
+            # Includes KeyboardInterrupt: stop queued uploads, let running ones
+            # finish, and release every blob that will not get a row.
+            for _, _, future in in_flight:
+                future.cancel()
+            orphaned = [row["storage_key"] for _, row in batch]
+            for _, _, future in in_flight:
+                if not future.cancelled():
+                    storage_key, _ = future.result()
+                    if storage_key is not None:
+                        orphaned.append(storage_key)
+            delete_blobs(adapter, orphaned)
+            raise
+        finally:
+            journal.close()
+    os.remove(journal_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("archive", help="directory or .zip file")
+    parser.add_argument("--uploaded-by", required=True, help="email of the user recorded as uploader")
+    parser.add_argument("--manifest", help="CSV with path, member, doc_date, condition, description")
+    parser.add_argument("--pattern", default=FILENAME_PATTERN, help="regex with date and condition groups")
+    parser.add_argument("--default-condition", help="condition for files the manifest and pattern miss")
+    parser.add_argument("--create-members", action="store_true", help="create members for unknown folders")
+    parser.add_argument("--checkpoint", help="defaults to <archive>.import-checkpoint")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    parser.add_argument("--previews", action="store_true", help="render thumbnails after each batch")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without uploading")
+    args = parser.parse_args()
+
+    check_database(engine)
+    ensure_schema(engine)
+    with get_db_session() as db:
+        uploader = user_by_email(db, args.uploaded_by)
+        uploader_id = uploader.id if uploader else None
+    if uploader_id is None:
+        raise SystemExit(f"No user with email {args.uploaded_by}")
+
+    archive = args.archive.rstrip("/" + os.sep)
+    source = ZipSource(archive) if zipfile.is_zipfile(archive) else DirectorySource(archive)
+    checkpoint_path = args.checkpoint or f"{archive}.import-checkpoint"
+    report = ImportReport()
+    try:
+        manifest = read_manifest(args.manifest) if args.manifest else {}
+        entries = plan_import(source, manifest, re.compile(args.pattern), args.default_condition, report)
+        if args.dry_run:
+            for entry in entries:
+                print(f"{entry.member}\t{entry.doc_date}\t{entry.condition}\t{entry.path}")
+        else:
+            members = resolve_members(entries, uploader_id, args.create_members, report)
+            run_import(
+                get_storage_adapter(),
+                source,
+                entries,
+                members,
+                uploader_id,
+                checkpoint_path,
+                report,
+                batch_size=args.batch_size,
+                workers=args.workers,
+                previews=args.previews,
+            )
+    finally:
+        source.close()
+
+    for path, reason in report.skipped:
+        print(f"skipped {path}: {reason}")
+    for path, error in report.failed:
+        print(f"failed {path}: {error}")
+    files_per_second, mb_per_second = report.rates()
+    print(
+        f"imported {report.imported} files ({report.bytes / 1_000_000:.1f} MB) "
+        f"in {time.perf_counter() - report.started_at:.1f}s: {files_per_second:.1f} files/s, {mb_per_second:.2f} MB/s; "
+        f"{report.already_imported} already imported, {len(report.skipped)} skipped, {len(report.failed)} failed"
+    )
+    if report.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
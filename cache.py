@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Hashable
+
+from db import get_db_session
+from instrumentation import metrics
+from models import Document, FamilyMember
+from queries import (
+    DocumentCursor,
+    DocumentFacets,
+    DocumentFilters,
+    MemberStats,
+    document_facets,
+    list_documents,
+    list_family_members,
+    member_stats,
+)
+
+MEMBERS = "members"
+# Aggregates across every member, so any document write invalidates them.
+MEMBER_STATS = "member_stats"
+
+
+class QueryCache:
+    """Read-through TTL cache shared by every Streamlit session in the process.
+
+    Entries are grouped under a tag so write paths can drop everything that
+    depends on the rows they touched. A TTL of 0 disables caching.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 5000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[Hashable, tuple[Any, float]]] = {}
+        self._size = 0
+        # Bumped by invalidate(); a load that started under an older
+        # generation may hold pre-write rows and is not stored.
+        self._generations: dict[str, int] = {}
+        self._epoch = 0
+
+    def get_or_load(self, tag: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(tag, {}).get(key)
+            if entry and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(tag, 0))
+        value = loader()
+        if self.ttl_seconds <= 0:
+            return value
+        with self._lock:
+            if (self._epoch, self._generations.get(tag, 0)) != generation:
+                return value
+            if self._size >= self.max_entries:
+                self._entries.clear()
+                self._size = 0
+            entries = self._entries.setdefault(tag, {})
+            if key not in entries:
+                self._size += 1
+            entries[key] = (value, now + self.ttl_seconds)
+        return value
+
+    def invalidate(self, tag: str) -> None:
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            self._size -= len(self._entries.pop(tag, {}))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+
+query_cache = QueryCache(ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "60")))
+metrics.register_collector(lambda: {f"query_cache_{name}": value for name, value in query_cache.stats().items()})
+
+
+def _documents_tag(member_id: uuid.UUID) -> str:
+    return f"documents:{member_id}"
+
+
+def _load(query, *args):
+    with get_db_session() as db:
+        return query(db, *args)
+
+
+def cached_family_members() -> list[FamilyMember]:
+    return query_cache.get_or_load(MEMBERS, "all", lambda: _load(list_family_members))
+
+
+def cached_member_stats() -> dict[uuid.UUID, MemberStats]:
+    return query_cache.get_or_load(MEMBER_STATS, "all", lambda: _load(member_stats))
+
+
+def cached_document_facets(member_id: uuid.UUID) -> DocumentFacets:
+    return query_cache.get_or_load(
+        _documents_tag(member_id), "facets", lambda: _load(document_facets, member_id)
+    )
+
+
+def cached_document_page(
+    member_id: uuid.UUID, filters: DocumentFilters, after: DocumentCursor | None
+) -> tuple[list[Document], DocumentCursor | None]:
+    return query_cache.get_or_load(
+        _documents_tag(member_id),
+        ("page", filters, after),
+        lambda: _load(list_documents, member_id, filters, after),
+    )
+
+
+def invalidate_members() -> None:
+    query_cache.invalidate(MEMBERS)
+    query_cache.invalidate(MEMBER_STATS)
+
+
+def invalidate_documents(member_id: uuid.UUID) -> None:
+    query_cache.invalidate(_documents_tag(member_id))
+    query_cache.invalidate(MEMBER_STATS)
@@ -0,0 +1,11 @@
+import os
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Read a flag the same way everywhere: 1/true/yes/on, case-insensitive, enable it."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in TRUE_VALUES
@@ -1,10 +1,177 @@
+import logging
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from config import env_bool
+from instrumentation import instrument_engine, metrics
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///family_medical_records.db")
 
-engine = create_engine(DATABASE_URL, future=True)
+# Supabase's transaction-mode pgbouncer listens on 6543.
+PGBOUNCER_PORT = 6543
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+
+    def attach(self, engine: Engine) -> None:
+        pool = engine.pool
+
+        @event.listens_for(pool, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(pool, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self.checkouts += 1
+                self.checked_out += 1
+                self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+                if hasattr(pool, "overflow"):
+                    self.peak_overflow = max(self.peak_overflow, pool.overflow())
+
+        @event.listens_for(pool, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            with self._lock:
+                self.checkins += 1
+                self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "peak_overflow": self.peak_overflow,
+            }
+
+
+def _sqlite_options() -> tuple[dict, list[str], list[str]]:
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={_env_int('DB_SQLITE_BUSY_TIMEOUT_MS', 5000)}",
+        f"PRAGMA mmap_size={_env_int('DB_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+    ]
+    # Streamlit runs each session on its own thread, so pooled connections
+    # must be usable across threads.
+    return {"connect_args": {"check_same_thread": False}}, pragmas, []
+
+
+def _postgres_options(url) -> tuple[dict, list[str], list[str]]:
+    pgbouncer = env_bool("DB_PGBOUNCER", url.port == PGBOUNCER_PORT)
+    statement_timeout = _env_int("DB_STATEMENT_TIMEOUT_MS", 30000)
+    options = {
+        "pool_pre_ping": env_bool("DB_POOL_PRE_PING", True),
+        "connect_args": {},
+    }
+    if env_bool("DB_NULL_POOL", False):
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            pool_size=_env_int("DB_POOL_SIZE", 5),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+        )
+
+    on_begin = []
+    if pgbouncer:
+        # Transaction-mode pgbouncer hands each transaction a different server
+        # connection: disable prepared statements and skip startup options,
+        # which pgbouncer rejects. A session-level SET would stick to whichever
+        # backend ran it, so the timeout is set per transaction instead.
+        if url.get_driver_name() == "psycopg":
+            options["connect_args"]["prepare_threshold"] = None
+        on_begin.append(f"SET LOCAL statement_timeout = {statement_timeout}")
+    else:
+        options["connect_args"]["options"] = f"-c statement_timeout={statement_timeout}"
+    return options, [], on_begin
+
+
+def build_engine(database_url: str = DATABASE_URL) -> Engine:
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        options, on_connect, on_begin = _sqlite_options()
+    elif url.get_backend_name() == "postgresql":
+        options, on_connect, on_begin = _postgres_options(url)
+    else:
+        options, on_connect, on_begin = {"pool_pre_ping": env_bool("DB_POOL_PRE_PING", True)}, [], []
+
+    engine = create_engine(url, future=True, echo=env_bool("DB_ECHO", False), **options)
+
+    if on_connect:
+
+        @event.listens_for(engine, "connect")
+        def apply_connect_statements(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for statement in on_connect:
+                    cursor.execute(statement)
+            finally:
+                cursor.close()
+
+    if on_begin:
+
+        @event.listens_for(engine, "begin")
+        def apply_begin_statements(connection):
+            for statement in on_begin:
+                connection.exec_driver_sql(statement)
+
+    return engine
+
+
+_healthy_engines: set[Engine] = set()
+
+
+def check_database(engine: Engine, attempts: int | None = None, delay: float = 1.0) -> None:
+    """Fail fast at startup if the database is unreachable, retrying briefly.
+
+    Runs once per engine per process; pool pre-ping covers later outages.
+    """
+    if engine in _healthy_engines:
+        return
+    attempts = attempts or _env_int("DB_HEALTHCHECK_ATTEMPTS", 3)
+    for attempt in range(1, attempts + 1):
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            _healthy_engines.add(engine)
+            return
+        except Exception as exc:
+            if attempt == attempts:
+                raise
+            logger.warning("Database health check failed (attempt %s/%s): %s", attempt, attempts, exc)
+            time.sleep(delay * attempt)
+
+
+engine = build_engine()
+pool_metrics = PoolMetrics()
+pool_metrics.attach(engine)
+instrument_engine(engine)
+metrics.register_collector(lambda: {f"db_pool_{name}": value for name, value in pool_metrics.snapshot().items()})
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 
@@ -0,0 +1,102 @@
+"""Convert an existing bucket or upload directory to content-addressed keys in place.
+
+Every blob referenced by a document, kept original or preview is hashed. The first copy of
+each distinct content is copied server-side (a hard link for local storage)
+to its content key, rows are repointed, and the old key is released. Later
+duplicates are released without copying.
+
+    python dedupe_storage.py [--dry-run]
+"""
+
+import argparse
+import hashlib
+
+from sqlalchemy import select, update
+
+from blobs import defer_blob_deletion, release_blobs
+from db import get_db_session
+from models import Document, DocumentPreview
+from storage import content_key, get_storage_adapter, is_content_key
+
+
+def _digest(adapter, storage_key: str) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in adapter.download_stream(storage_key):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def dedupe(dry_run: bool = False) -> dict[str, int]:
+    adapter = get_storage_adapter(content_addressed=False)
+    with get_db_session() as db:
+        storage_keys = set(db.execute(select(Document.storage_key)).scalars())
+        storage_keys.update(db.execute(select(DocumentPreview.storage_key)).scalars())
+        storage_keys.update(
+            db.execute(
+                select(Document.original_storage_key).where(Document.original_storage_key.is_not(None))
+            ).scalars()
+        )
+
+    report = {"blobs": 0, "duplicates": 0, "bytes_scanned": 0, "bytes_saved": 0, "missing": 0}
+    present = set()
+    for storage_key in sorted(storage_key for storage_key in storage_keys if not is_content_key(storage_key)):
+        try:
+            digest, size = _digest(adapter, storage_key)
+        except Exception as exc:
+            print(f"skipping {storage_key}: {exc}")
+            report["missing"] += 1
+            continue
+        report["blobs"] += 1
+        report["bytes_scanned"] += size
+        target_key = content_key(digest)
+        if not dry_run:
+            defer_blob_deletion(target_key)
+        duplicate = target_key in present or adapter.exists(target_key)
+        if duplicate:
+            report["duplicates"] += 1
+            report["bytes_saved"] += size
+        present.add(target_key)
+        if dry_run:
+            continue
+
+        if not duplicate:
+            adapter.copy(storage_key, target_key)
+        with get_db_session() as db:
+            db.execute(
+                update(Document)
+                .where(Document.storage_key == storage_key)
+                .values(storage_key=target_key, size_bytes=size)
+            )
+            db.execute(
+                update(Document)
+                .where(Document.original_storage_key == storage_key)
+                .values(original_storage_key=target_key)
+            )
+            db.execute(
+                update(DocumentPreview)
+                .where(DocumentPreview.storage_key == storage_key)
+                .values(storage_key=target_key)
+            )
+            db.commit()
+        release_blobs(adapter, [storage_key])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report savings without changing anything")
+    args = parser.parse_args()
+
+    report = dedupe(dry_run=args.dry_run)
+    saved_pct = 100 * report["bytes_saved"] / report["bytes_scanned"] if report["bytes_scanned"] else 0
+    prefix = "would save" if args.dry_run else "saved"
+    print(
+        f"{report['blobs']} blobs scanned ({report['bytes_scanned']} bytes), {report['duplicates']} duplicates, "
+        f"{report['missing']} missing; {prefix} {report['bytes_saved']} bytes ({saved_pct:.1f}%)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Transactional deletion of documents and members, with batched blob cleanup.
+
+Rows are removed and their blobs queued for deletion in one transaction;
+storage cleanup then runs in batches, inline or as a background job when
+JOB_QUEUE_ENABLED is set, and anything that fails stays in the
+pending_blob_deletions queue. Retry the queue with:
+
+    python deletion.py --retry
+"""
+
+import argparse
+import uuid
+
+from sqlalchemy import delete, select
+
+from blobs import BLOB_DELETION_BATCH_SIZE, enqueue_blob_deletions, has_due_blob_deletions, process_blob_deletions
+from db import get_db_session
+from jobs import JOB_QUEUE_ENABLED, enqueue_blob_deletion_jobs
+from models import Document, DocumentPreview, FamilyMember
+from storage import StorageAdapter, get_storage_adapter
+
+
+def _storage_keys(db, document_filter) -> list[str]:
+    document_ids = select(Document.id).where(document_filter)
+    storage_keys = list(db.execute(select(Document.storage_key).where(document_filter)).scalars())
+    storage_keys += db.execute(
+        select(Document.original_storage_key).where(document_filter, Document.original_storage_key.is_not(None))
+    ).scalars()
+    storage_keys += db.execute(
+        select(DocumentPreview.storage_key).where(DocumentPreview.document_id.in_(document_ids))
+    ).scalars()
+    return storage_keys
+
+
+def _delete_rows(db, document_filter) -> list[str]:
+    storage_keys = _storage_keys(db, document_filter)
+    document_ids = select(Document.id).where(document_filter)
+    db.execute(delete(DocumentPreview).where(DocumentPreview.document_id.in_(document_ids)))
+    db.execute(delete(Document).where(document_filter))
+    enqueue_blob_deletions(db, storage_keys)
+    return storage_keys
+
+
+def _cleanup(adapter: StorageAdapter, storage_keys: list[str]) -> list[str]:
+    failed = []
+    for start in range(0, len(storage_keys), BLOB_DELETION_BATCH_SIZE):
+        _, batch_failed = process_blob_deletions(adapter, storage_keys[start : start + BLOB_DELETION_BATCH_SIZE])
+        failed += batch_failed
+    return failed
+
+
+def delete_documents(adapter: StorageAdapter, document_ids: list[uuid.UUID]) -> list[str]:
+    """Delete documents and their blobs; returns storage keys left queued for retry."""
+    with get_db_session() as db:
+        storage_keys = _delete_rows(db, Document.id.in_(document_ids))
+        if JOB_QUEUE_ENABLED:
+            enqueue_blob_deletion_jobs(db, storage_keys)
+        db.commit()
+    return [] if JOB_QUEUE_ENABLED else _cleanup(adapter, storage_keys)
+
+
+def delete_member(adapter: StorageAdapter, member_id: uuid.UUID) -> list[str]:
+    """Delete a member with all documents and blobs; returns storage keys left queued for retry."""
+    with get_db_session() as db:
+        storage_keys = _delete_rows(db, Document.member_id == member_id)
+        db.execute(delete(FamilyMember).where(FamilyMember.id == member_id))
+        if JOB_QUEUE_ENABLED:
+            enqueue_blob_deletion_jobs(db, storage_keys)
+        db.commit()
+    return [] if JOB_QUEUE_ENABLED else _cleanup(adapter, storage_keys)
+
+
+def retry_pending(adapter: StorageAdapter) -> tuple[int, int]:
+    deleted_total = failed_total = 0
+    while True:
+        deleted, failed = process_blob_deletions(adapter)
+        deleted_total += len(deleted)
+        failed_total += len(failed)
+        # Every batch either removes its rows (including keys still referenced,
+        # which delete nothing) or pushes failed ones back by their backoff,
+        # so the loop ends once nothing due remains.
+        if not has_due_blob_deletions():
+            return deleted_total, failed_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--retry", action="store_true", help="retry queued blob deletions that are due")
+    args = parser.parse_args()
+    if args.retry:
+        deleted, failed = retry_pending(get_storage_adapter())
+        print(f"{deleted} blob(s) deleted, {failed} still failing")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
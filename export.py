@@ -0,0 +1,286 @@
+"""Stream family members, document metadata and blobs into a ZIP or tar archive.
+
+Blobs are fetched concurrently through the StorageAdapter into spooled
+temporary files (in memory up to EXPORT_SPOOL_SIZE, then on disk) and written
+to the archive in order, so neither the archive nor a whole file is held in
+memory. manifest.json, written last, lists every member and document with its
+archive path, size and SHA-256, plus the created_at watermark.
+
+    python export.py family-backup.zip
+    python export.py family-backup.tar --state export-state.json   # incremental
+
+With --state, only documents created since the watermark recorded by the
+previous successful export are included, and the new watermark is saved.
+created_at is only second-precise on SQLite and is the transaction start on
+Postgres, so a row can commit with a created_at behind a watermark already
+saved. Each run therefore re-scans EXPORT_WATERMARK_OVERLAP_SECONDS behind
+the watermark and skips the documents the state file lists as exported.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+import tempfile
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import select
+
+from db import get_db_session
+from models import FamilyMember
+from queries import documents_created_since
+from storage import UPLOAD_CHUNK_SIZE, StorageAdapter, get_storage_adapter
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "4"))
+EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", str(8 * 1024 * 1024)))
+EXPORT_WATERMARK_OVERLAP_SECONDS = int(os.getenv("EXPORT_WATERMARK_OVERLAP_SECONDS", "300"))
+# Exports built in the app are held in memory by Streamlit's media store.
+EXPORT_UI_MAX_BYTES = int(os.getenv("EXPORT_UI_MAX_BYTES", str(200 * 1024 * 1024)))
+EXPORT_FORMATS = ("zip", "tar", "tar.gz")
+UNSAFE_PATH_CHARACTERS = re.compile(r"[^\w.\- ]+")
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+@dataclass
+class ExportSummary:
+    members: int
+    documents: int
+    bytes: int
+    watermark: datetime | None
+    # Documents within the overlap window behind the watermark, for the state file.
+    recent_ids: list[str] = field(default_factory=list)
+
+
+def _safe_name(value: str) -> str:
+    return UNSAFE_PATH_CHARACTERS.sub("_", value).strip(" .") or "unnamed"
+
+
+def _fetch(adapter: StorageAdapter, storage_key: str) -> tuple[BinaryIO, int, str]:
+    spooled = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        for chunk in adapter.download_stream(storage_key):
+            spooled.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, size, digest.hexdigest()
+
+
+class _ArchiveWriter:
+    def __init__(self, output: BinaryIO, fmt: str):
+        self.fmt = fmt
+        if fmt == "zip":
+            # Stored, not deflated: scans and PDFs are already compressed.
+            self.archive = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self.archive = tarfile.open(fileobj=output, mode="w|gz" if fmt == "tar.gz" else "w|")
+
+    def add(self, name: str, stream: BinaryIO, size: int, modified: float) -> None:
+        if self.fmt == "zip":
+            info = zipfile.ZipInfo(name, date_time=time.localtime(modified)[:6])
+            info.file_size = size
+            with self.archive.open(info, "w") as target:
+                while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                    target.write(chunk)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = modified
+            self.archive.addfile(info, stream)
+
+    def close(self) -> None:
+        self.archive.close()
+
+
+def _timestamp(value: datetime | None) -> float:
+    if value is None:
+        return time.time()
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def export_archive(
+    adapter: StorageAdapter,
+    output: BinaryIO,
+    fmt: str = "zip",
+    member_ids: list[uuid.UUID] | None = None,
+    since: datetime | None = None,
+    workers: int = EXPORT_WORKERS,
+    exported_ids: set[str] | None = None,
+    max_bytes: int | None = None,
+) -> ExportSummary:
+    """Write an archive to `output`, which only needs to support write().
+
+    With exported_ids (an incremental export), `since` is a previous
+    watermark: the overlap window behind it is re-scanned and the documents
+    listed are skipped. ExportTooLarge is raised once the export is known to
+    exceed max_bytes.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}")
+    overlap = timedelta(seconds=EXPORT_WATERMARK_OVERLAP_SECONDS)
+    with get_db_session() as db:
+        statement = select(FamilyMember).order_by(FamilyMember.full_name)
+        if member_ids is not None:
+            statement = statement.where(FamilyMember.id.in_(member_ids))
+        members = db.execute(statement).scalars().all()
+        scan_from = since - overlap if since is not None and exported_ids is not None else since
+        scanned = documents_created_since(db, [member.id for member in members], scan_from)
+    documents = [document for document in scanned if str(document.id) not in (exported_ids or ())]
+    # Rows written before size_bytes existed count as 0 until the check below.
+    if max_bytes is not None and sum(document.size_bytes or 0 for document in documents) > max_bytes:
+        raise ExportTooLarge(f"Export exceeds {max_bytes} bytes")
+
+    folders = {member.id: f"{_safe_name(member.full_name)}-{str(member.id)[:8]}" for member in members}
+    manifest = {
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "since": since.isoformat() if since else None,
+        "watermark": None,
+        "members": [
+            {
+                "id": str(member.id),
+                "full_name": member.full_name,
+                "dob": member.dob.isoformat() if member.dob else None,
+                "created_at": member.created_at.isoformat(),
+                "folder": folders[member.id],
+            }
+            for member in members
+        ],
+        "documents": [],
+    }
+
+    writer = _ArchiveWriter(output, fmt)
+    total_bytes = 0
+    # Documents arrive oldest first, so the last one scanned sets the watermark.
+    watermark = scanned[-1].created_at if scanned else since
+    if exported_ids is not None and since is not None and watermark < since:
+        watermark = since
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="export") as pool:
+        # A bounded window of in-flight downloads keeps the pool busy without
+        # spooling the whole export to disk ahead of the writer.
+        in_flight: deque = deque()
+        remaining = iter(documents)
+
+        def submit_next() -> None:
+            document = next(remaining, None)
+            if document is not None:
+                in_flight.append((document, pool.submit(_fetch, adapter, document.storage_key)))
+
+        for _ in range(2 * max(1, workers)):
+            submit_next()
+        try:
+            while in_flight:
+                document, future = in_flight.popleft()
+                submit_next()
+                stream, size, digest = future.result()
+                with stream:
+                    path = (
+                        f"{folders[document.member_id]}/{document.doc_date.isoformat()}_{str(document.id)[:8]}_"
+                        f"{_safe_name(document.file_name)}"
+                    )
+                    writer.add(path, stream, size, _timestamp(document.created_at))
+                total_bytes += size
+                if max_bytes is not None and total_bytes > max_bytes:
+                    raise ExportTooLarge(f"Export exceeds {max_bytes} bytes")
+                manifest["documents"].append(
+                    {
+                        "id": str(document.id),
+                        "member_id": str(document.member_id),
+                        "doc_date": document.doc_date.isoformat(),
+                        "condition": document.condition,
+                        "description": document.description,
+                        "file_name": document.file_name,
+                        "mime_type": document.mime_type,
+                        "created_at": document.created_at.isoformat(),
+                        "path": path,
+                        "size": size,
+                        "sha256": digest,
+                    }
+                )
+        finally:
+            for _, future in in_flight:
+                if not future.cancel() and future.exception() is None:
+                    future.result()[0].close()
+
+    manifest["watermark"] = watermark.isoformat() if watermark else None
+    payload = json.dumps(manifest, indent=2).encode("utf-8")
+    writer.add("manifest.json", io.BytesIO(payload), len(payload), time.time())
+    writer.close()
+    recent_ids = [
+        str(document.id) for document in scanned if watermark is not None and document.created_at >= watermark - overlap
+    ]
+    return ExportSummary(len(members), len(documents), total_bytes, watermark, recent_ids)
+
+
+def export_format(path: str) -> str:
+    for fmt in sorted(EXPORT_FORMATS, key=len, reverse=True):
+        if path.endswith(f".{fmt}"):
+            return fmt
+    return "tar.gz" if path.endswith(".tgz") else "zip"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="archive path; .zip, .tar or .tar.gz/.tgz selects the format")
+    parser.add_argument("--member", action="append", type=uuid.UUID, help="member id to export (repeatable)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only documents created since this time")
+    parser.add_argument("--state", help="JSON file holding the watermark of the previous export")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    args = parser.parse_args()
+
+    since = args.since
+    exported_ids = None
+    if args.state and since is None and os.path.exists(args.state):
+        with open(args.state, encoding="utf-8") as handle:
+            state = json.load(handle)
+        since = datetime.fromisoformat(state["watermark"]) if state.get("watermark") else None
+        exported_ids = set(state.get("exported_ids", []))
+
+    started = time.perf_counter()
+    partial_path = f"{args.output}.partial"
+    with open(partial_path, "wb") as output:
+        summary = export_archive(
+            get_storage_adapter(), output, export_format(args.output), args.member, since, args.workers, exported_ids
+        )
+    os.replace(partial_path, args.output)
+    if args.state:
+        with open(args.state, "w", encoding="utf-8") as handle:
+            json.dump(
+                {
+                    "watermark": summary.watermark.isoformat() if summary.watermark else None,
+                    "exported_ids": summary.recent_ids,
+                },
+                handle,
+            )
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"exported {summary.documents} documents for {summary.members} members "
+        f"({summary.bytes / 1_000_000:.1f} MB) to {args.output} in {elapsed:.1f}s"
+        + (f", watermark {summary.watermark.isoformat()}" if summary.watermark else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""HTTP endpoint serving LocalStorageAdapter files through signed, expiring URLs.
+
+URLs are produced by LocalStorageAdapter.get_signed_url() when
+LOCAL_STORAGE_PUBLIC_URL is set, and mirror Supabase signed URLs:
+
+    GET /files/<storage key>?expires=<unix time>&token=<HMAC-SHA256>
+
+Files are sent with sendfile(2), support single-range requests and answer
+conditional GETs from ETag/Last-Modified.
+
+    python file_server.py
+"""
+
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from dotenv import load_dotenv
+
+from storage import LocalStorageAdapter, is_content_key, verify_local_token
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class SignedFileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    adapter: LocalStorageAdapter
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _error(self, status: HTTPStatus) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _authorized_path(self) -> str | None:
+        url = urlsplit(self.path)
+        if not url.path.startswith("/files/"):
+            return None
+        storage_key = unquote(url.path[len("/files/") :])
+        query = parse_qs(url.query)
+        try:
+            expires = int(query["expires"][0])
+            token = query["token"][0]
+        except (KeyError, ValueError):
+            return None
+        if not verify_local_token(self.adapter.signing_secret, storage_key, expires, token):
+            return None
+        try:
+            return self.adapter.local_path(storage_key)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _etag(storage_key: str, stat: os.stat_result) -> str:
+        if is_content_key(storage_key):
+            return f'"{os.path.basename(storage_key)}"'
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def _not_modified(self, etag: str, stat: os.stat_result) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [value.strip() for value in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _byte_range(self, size: int, etag: str) -> tuple[int, int] | None | bool:
+        """Return (start, end) for a satisfiable Range, None for the whole file, False if unsatisfiable."""
+        header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if not header or (if_range and if_range.strip() != etag):
+            return None
+        match = RANGE_PATTERN.match(header.strip())
+        if not match or match.groups() == ("", ""):
+            return None
+        start, end = match.groups()
+        if start == "":
+            length = int(end)
+            if length == 0:
+                return False
+            return max(0, size - length), size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+        if start >= size or start > end:
+            return False
+        return start, end
+
+    def _serve(self, send_body: bool) -> None:
+        file_path = self._authorized_path()
+        if file_path is None:
+            self._error(HTTPStatus.FORBIDDEN)
+            return
+        storage_key = unquote(urlsplit(self.path).path[len("/files/") :])
+        try:
+            file_handle = open(file_path, "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            self._error(HTTPStatus.NOT_FOUND)
+            return
+
+        with file_handle:
+            stat = os.fstat(file_handle.fileno())
+            etag = self._etag(storage_key, stat)
+            common_headers = {
+                "ETag": etag,
+                "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+                "Accept-Ranges": "bytes",
+                # Signed URLs are per-user, so only the browser may cache.
+                "Cache-Control": "private, max-age=3600",
+            }
+            if self._not_modified(etag, stat):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                for name, value in common_headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                return
+
+            byte_range = self._byte_range(stat.st_size, etag)
+            if byte_range is False:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{stat.st_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range is None:
+                start, end = 0, stat.st_size - 1
+                self.send_response(HTTPStatus.OK)
+            else:
+                start, end = byte_range
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+
+            content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(max(0, end - start + 1)))
+            self.send_header("Content-Disposition", "inline")
+            for name, value in common_headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if send_body and end >= start:
+                self.wfile.flush()
+                # socket.sendfile uses sendfile(2) where available, so file
+                # bytes never pass through Python buffers.
+                self.connection.sendfile(file_handle, offset=start, count=end - start + 1)
+
+
+def build_server(adapter: LocalStorageAdapter, host: str, port: int) -> ThreadingHTTPServer:
+    handler = type("ConfiguredSignedFileHandler", (SignedFileHandler,), {"adapter": adapter})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    load_dotenv()
+    signing_secret = os.getenv("LOCAL_STORAGE_SIGNING_SECRET")
+    if not signing_secret:
+        raise SystemExit("LOCAL_STORAGE_SIGNING_SECRET is required to serve local storage")
+    adapter = LocalStorageAdapter(
+        base_path=os.getenv("LOCAL_STORAGE_PATH", "./uploads"),
+        signing_secret=signing_secret,
+    )
+    host = os.getenv("LOCAL_FILE_SERVER_HOST", "0.0.0.0")
+    port = int(os.getenv("LOCAL_FILE_SERVER_PORT", "8502"))
+    server = build_server(adapter, host, port)
+    print(f"Serving {adapter.base_path} on http://{host}:{port}/files/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
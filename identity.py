@@ -0,0 +1,79 @@
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import streamlit as st
+from sqlalchemy import select
+
+from db import get_db_session
+from models import User
+
+SESSION_KEY = "current_user"
+ROLES = {"admin", "viewer"}
+# Role changes made in the database reach signed-in sessions within this long.
+PRINCIPAL_REFRESH_SECONDS = float(os.getenv("PRINCIPAL_REFRESH_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: uuid.UUID
+    email: str
+    role: str
+    loaded_at: float = field(default_factory=time.monotonic, compare=False)
+
+    def __post_init__(self):
+        if not isinstance(self.id, uuid.UUID):
+            object.__setattr__(self, "id", uuid.UUID(str(self.id)))
+        if self.role not in ROLES:
+            raise ValueError(f"Unknown role: {self.role}")
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+
+def principal_for(user_id: uuid.UUID | str, email: str, role: str) -> Principal | None:
+    """Return the user's principal, or None when their stored role grants no access."""
+    if role not in ROLES:
+        return None
+    return Principal(id=uuid.UUID(str(user_id)), email=email, role=role)
+
+
+def _refresh(principal: Principal) -> Principal | None:
+    with get_db_session() as db:
+        row = db.execute(select(User.email, User.role).where(User.id == principal.id)).one_or_none()
+    if row is None:
+        return None
+    return principal_for(principal.id, row.email, row.role)
+
+
+def get_current_user() -> Principal | None:
+    stored = st.session_state.get(SESSION_KEY)
+    if stored is None:
+        return None
+    principal = stored
+    if not isinstance(principal, Principal):
+        # Sessions signed in before principals were introduced hold a plain dict.
+        try:
+            principal = Principal(id=principal["id"], email=principal["email"], role=principal["role"])
+        except (KeyError, TypeError, ValueError):
+            set_current_user(None)
+            return None
+    if time.monotonic() - principal.loaded_at >= PRINCIPAL_REFRESH_SECONDS:
+        principal = _refresh(principal)
+    if principal is not stored:
+        set_current_user(principal)
+    return principal
+
+
+def set_current_user(principal: Principal | None) -> None:
+    if principal is None:
+        st.session_state.pop(SESSION_KEY, None)
+        return
+    st.session_state[SESSION_KEY] = principal
+
+
+def is_admin() -> bool:
+    principal = get_current_user()
+    return principal is not None and principal.is_admin
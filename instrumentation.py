@@ -0,0 +1,273 @@
+"""Process-wide timings for database queries, storage calls and password hashing.
+
+Every observation lands in a labelled histogram, exported in Prometheus text
+format by prometheus_text() and, when METRICS_PORT is set, over HTTP. While a
+Streamlit rerun is wrapped in track_rerun(), observations made on the script
+thread are also collected into a RerunStats for the admin debug panel, and a
+statement repeated N_PLUS_ONE_THRESHOLD times in one rerun is logged as a
+likely N+1 query.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import env_bool
+
+logger = logging.getLogger(__name__)
+
+
+INSTRUMENTATION_ENABLED = env_bool("INSTRUMENTATION_ENABLED", True)
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+LOG_RERUNS = env_bool("INSTRUMENTATION_LOG_RERUNS", False)
+
+# Seconds; spans a cached SQLite read up to a slow bcrypt or storage call.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+BIND_LIST_PATTERN = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)\s*\)")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound containing the q-th observation."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._collectors: list[Callable[[], dict[str, float]]] = []
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, collector: Callable[[], dict[str, float]]) -> None:
+        """Add a callable returning gauge values, sampled at export time."""
+        self._collectors.append(collector)
+
+    def summary(self, name: str) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    **dict(labels),
+                    "count": histogram.count,
+                    "mean_ms": 1000 * histogram.sum / histogram.count if histogram.count else 0.0,
+                    "p95_ms": 1000 * histogram.quantile(0.95),
+                }
+                for (metric, labels), histogram in sorted(self._histograms.items())
+                if metric == name
+            ]
+
+    def prometheus_text(self) -> str:
+        def label_text(labels: tuple, extra: tuple = ()) -> str:
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{label_text(labels, (('le', bound),))} {cumulative}")
+            lines.append(f'{name}_bucket{label_text(labels, (("le", "+Inf"),))} {histogram.count}')
+            lines.append(f"{name}_sum{label_text(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{label_text(labels)} {value:.15g}")
+        for collector in self._collectors:
+            for name, value in collector().items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+@dataclass
+class RerunStats:
+    started_at: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    query_seconds: float = 0.0
+    statements: dict[str, list] = field(default_factory=dict)
+    storage_calls: dict[str, list] = field(default_factory=dict)
+    auth_calls: dict[str, list] = field(default_factory=dict)
+    n_plus_one: list[str] = field(default_factory=list)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def add(self, calls: dict[str, list], name: str, seconds: float) -> None:
+        entry = calls.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def log_line(self) -> str:
+        storage_count = sum(count for count, _ in self.storage_calls.values())
+        storage_seconds = sum(seconds for _, seconds in self.storage_calls.values())
+        auth_seconds = sum(seconds for _, seconds in self.auth_calls.values())
+        return (
+            f"rerun {1000 * self.elapsed:.1f} ms: {self.queries} queries {1000 * self.query_seconds:.1f} ms, "
+            f"{storage_count} storage calls {1000 * storage_seconds:.1f} ms, auth {1000 * auth_seconds:.1f} ms"
+            + (f", {len(self.n_plus_one)} N+1 warning(s)" if self.n_plus_one else "")
+        )
+
+
+_current_rerun: ContextVar[RerunStats | None] = ContextVar("current_rerun", default=None)
+
+
+@contextmanager
+def track_rerun() -> Iterator[RerunStats]:
+    stats = RerunStats()
+    token = _current_rerun.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_rerun.reset(token)
+        metrics.increment("streamlit_reruns_total")
+        metrics.observe("streamlit_rerun_seconds", stats.elapsed)
+        if LOG_RERUNS:
+            logger.info(stats.log_line())
+
+
+def fingerprint(statement: str) -> str:
+    """Collapse whitespace and expanded IN lists so repeats of one query compare equal."""
+    return BIND_LIST_PATTERN.sub("(?)", " ".join(statement.split()))
+
+
+def _record_query(statement: str, seconds: float) -> None:
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    metrics.observe("db_query_seconds", seconds, kind=kind)
+    stats = _current_rerun.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.query_seconds += seconds
+    key = fingerprint(statement)
+    stats.add(stats.statements, key, seconds)
+    if stats.statements[key][0] == N_PLUS_ONE_THRESHOLD:
+        stats.n_plus_one.append(key)
+        metrics.increment("db_n_plus_one_warnings_total")
+        logger.warning("Possible N+1: statement ran %s times in one rerun: %s", N_PLUS_ONE_THRESHOLD, key[:300])
+
+
+def instrument_engine(engine: Engine) -> None:
+    if not INSTRUMENTATION_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started_at"].pop()
+        _record_query(statement, time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started_at"):
+            connection.info["query_started_at"].pop()
+
+
+def record_storage_call(operation: str, backend: str, seconds: float) -> None:
+    metrics.observe("storage_call_seconds", seconds, operation=operation, backend=backend)
+    stats = _current_rerun.get()
+    if stats is not None:
+        stats.add(stats.storage_calls, f"{backend}.{operation}", seconds)
+
+
+def record_auth_call(operation: str, seconds: float) -> None:
+    metrics.observe("auth_seconds", seconds, operation=operation)
+    stats = _current_rerun.get()
+    if stats is not None:
+        stats.add(stats.auth_calls, operation, seconds)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server: ThreadingHTTPServer | None = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int | None = None, host: str | None = None) -> ThreadingHTTPServer | None:
+    """Serve /metrics on METRICS_PORT from a daemon thread, once per process."""
+    global _metrics_server
+    port = port if port is not None else int(os.getenv("METRICS_PORT", "0") or 0)
+    if not port:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            address = (host or os.getenv("METRICS_HOST", "127.0.0.1"), port)
+            _metrics_server = ThreadingHTTPServer(address, _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+    return _metrics_server
@@ -0,0 +1,294 @@
+"""Persistent background job queue stored in the jobs table.
+
+Write paths enqueue jobs inside their own transaction with enqueue_job(), so a
+job exists exactly when the rows it refers to were committed. Workers claim
+due jobs with SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so any number of
+them can share the table; SQLite has no row locks, so claims there are a
+compare-and-set UPDATE and workers simply poll. A failed job is retried with
+exponential backoff until max_attempts, and a job whose worker died is
+reclaimed once its lease (JOB_LEASE_SECONDS) runs out. Run a worker with:
+
+    python jobs.py [--concurrency 4] [--kind generate_previews] [--once]
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from blobs import BLOB_DELETION_BATCH_SIZE, process_blob_deletions
+from config import env_bool
+from db import check_database, engine, get_db_session
+from instrumentation import metrics
+from models import Document, DocumentPreview, Job
+from previews import generate_previews
+from schema import ensure_schema
+from storage import get_storage_adapter
+
+logger = logging.getLogger(__name__)
+
+# Off by default so deployments without a worker keep doing this work inline.
+JOB_QUEUE_ENABLED = env_bool("JOB_QUEUE_ENABLED")
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", "30"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "900"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+JOB_MAINTENANCE_SECONDS = 300
+JOB_SPOOL_SIZE = 8 * 1024 * 1024
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+HANDLERS: dict[str, Callable[[dict], None]] = {}
+
+
+@dataclass(frozen=True)
+class ClaimedJob:
+    id: uuid.UUID
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+def job_handler(kind: str):
+    def register(handler: Callable[[dict], None]) -> Callable[[dict], None]:
+        HANDLERS[kind] = handler
+        return handler
+
+    return register
+
+
+def enqueue_job(
+    db: Session, kind: str, payload: dict, tag: str | None = None, max_attempts: int = JOB_MAX_ATTEMPTS
+) -> Job:
+    """Add a job to the caller's transaction; it becomes visible to workers on commit."""
+    job = Job(kind=kind, payload=payload, tag=tag, status=QUEUED, max_attempts=max_attempts)
+    db.add(job)
+    return job
+
+
+def enqueue_blob_deletion_jobs(db: Session, storage_keys: list[str], tag: str | None = None) -> None:
+    storage_keys = list(dict.fromkeys(storage_keys))
+    for start in range(0, len(storage_keys), BLOB_DELETION_BATCH_SIZE):
+        enqueue_job(
+            db, "process_blob_deletions", {"storage_keys": storage_keys[start : start + BLOB_DELETION_BATCH_SIZE]}, tag
+        )
+
+
+def member_tag(member_id: uuid.UUID) -> str:
+    return f"member:{member_id}"
+
+
+def job_counts(db: Session, tag: str | None = None) -> dict[str, int]:
+    statement = select(Job.status, func.count(Job.id)).group_by(Job.status)
+    if tag is not None:
+        statement = statement.where(Job.tag == tag)
+    return dict(db.execute(statement).all())
+
+
+def latest_job_error(db: Session, tag: str) -> str | None:
+    return db.execute(
+        select(Job.last_error).where(Job.tag == tag, Job.status == FAILED).order_by(Job.finished_at.desc()).limit(1)
+    ).scalar_one_or_none()
+
+
+def retry_failed_jobs(db: Session, tag: str) -> int:
+    """Queue the tag's failed jobs again with a fresh set of attempts."""
+    result = db.execute(
+        update(Job)
+        .where(Job.tag == tag, Job.status == FAILED)
+        .values(status=QUEUED, attempts=0, next_attempt_at=datetime.now(timezone.utc), finished_at=None)
+    )
+    return result.rowcount
+
+
+def dismiss_failed_jobs(db: Session, tag: str) -> int:
+    return db.execute(delete(Job).where(Job.tag == tag, Job.status == FAILED)).rowcount
+
+
+def _claimable(now: datetime, kinds: list[str] | None):
+    condition = or_(
+        and_(Job.status == QUEUED, Job.next_attempt_at <= now),
+        and_(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS)),
+    )
+    return and_(condition, Job.kind.in_(kinds)) if kinds else condition
+
+
+def claim_jobs(worker_id: str, limit: int, kinds: list[str] | None = None) -> list[ClaimedJob]:
+    if limit <= 0:
+        return []
+    now = datetime.now(timezone.utc)
+    with get_db_session() as db:
+        statement = (
+            select(Job.id, Job.attempts).where(_claimable(now, kinds)).order_by(Job.next_attempt_at).limit(limit)
+        )
+        if db.get_bind().dialect.name == "postgresql":
+            statement = statement.with_for_update(skip_locked=True)
+        claimed_ids = []
+        for job_id, attempts in db.execute(statement).all():
+            # On Postgres the row lock already guarantees this update wins; on
+            # SQLite it is the claim itself, and loses to a faster worker.
+            result = db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.attempts == attempts, _claimable(now, kinds))
+                .values(status=RUNNING, locked_by=worker_id, locked_at=now, attempts=attempts + 1)
+            )
+            if result.rowcount == 1:
+                claimed_ids.append(job_id)
+        db.commit()
+        if not claimed_ids:
+            return []
+        rows = db.execute(
+            select(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts).where(Job.id.in_(claimed_ids))
+        ).all()
+    return [ClaimedJob(*row) for row in rows]
+
+
+def _finish(job: ClaimedJob, worker_id: str, error: Exception | None) -> str:
+    now = datetime.now(timezone.utc)
+    if error is None:
+        values = {"status": SUCCEEDED, "finished_at": now, "last_error": None}
+    elif job.attempts >= job.max_attempts:
+        values = {"status": FAILED, "finished_at": now, "last_error": repr(error)[:2000]}
+    else:
+        delay = JOB_RETRY_SECONDS * 2 ** min(job.attempts - 1, 10)
+        values = {"status": QUEUED, "next_attempt_at": now + timedelta(seconds=delay), "last_error": repr(error)[:2000]}
+    with get_db_session() as db:
+        # A worker whose lease expired must not overwrite the job's new owner.
+        db.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.locked_by == worker_id, Job.attempts == job.attempts)
+            .values(locked_by=None, locked_at=None, **values)
+        )
+        db.commit()
+    return values["status"]
+
+
+def run_job(job: ClaimedJob, worker_id: str) -> str:
+    started = time.perf_counter()
+    error = None
+    try:
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        handler(job.payload)
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed on attempt %s", job.id, job.kind, job.attempts)
+        error = exc
+    status = _finish(job, worker_id, error)
+    metrics.observe("job_seconds", time.perf_counter() - started, kind=job.kind)
+    metrics.increment("jobs_total", kind=job.kind, status=status)
+    return status
+
+
+def _maintenance() -> None:
+    try:
+        # Blob deletions whose backoff has passed, as `python deletion.py --retry` would.
+        process_blob_deletions(get_storage_adapter())
+        cutoff = datetime.now(timezone.utc) - timedelta(days=JOB_RETENTION_DAYS)
+        with get_db_session() as db:
+            db.execute(delete(Job).where(Job.status.in_([SUCCEEDED, FAILED]), Job.finished_at < cutoff))
+            db.commit()
+    except Exception:
+        logger.exception("Job queue maintenance failed")
+
+
+def run_worker(
+    concurrency: int = JOB_CONCURRENCY,
+    kinds: list[str] | None = None,
+    poll_seconds: float = JOB_POLL_SECONDS,
+    once: bool = False,
+    stop: threading.Event | None = None,
+) -> int:
+    """Process jobs until `stop` is set, or until none are due with `once`; returns jobs run."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    stop = stop or threading.Event()
+    processed = 0
+    next_maintenance = 0.0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="job") as pool:
+        running: set = set()
+        while not stop.is_set():
+            if time.monotonic() >= next_maintenance:
+                _maintenance()
+                next_maintenance = time.monotonic() + JOB_MAINTENANCE_SECONDS
+            try:
+                claimed = claim_jobs(worker_id, max(1, concurrency) - len(running), kinds)
+            except Exception:
+                # A transient database error must not kill the worker; jobs
+                # already running carry on while it backs off.
+                logger.exception("Claiming jobs failed")
+                claimed = []
+                if not running:
+                    stop.wait(poll_seconds)
+                    continue
+            running.update(pool.submit(run_job, job, worker_id) for job in claimed)
+            if not running:
+                if once:
+                    break
+                stop.wait(poll_seconds)
+                continue
+            done, running = wait(running, timeout=None if claimed else poll_seconds, return_when=FIRST_COMPLETED)
+            processed += len(done)
+    return processed
+
+
+@job_handler("generate_previews")
+def _generate_previews(payload: dict) -> None:
+    document_id = uuid.UUID(payload["document_id"])
+    with get_db_session() as db:
+        document = db.get(Document, document_id)
+        # Deleted before the job ran, or rendered by an attempt whose worker
+        # died before recording success.
+        if document is None or db.execute(
+            select(DocumentPreview.id).where(DocumentPreview.document_id == document_id).limit(1)
+        ).first():
+            return
+        storage_key, file_name, mime_type = document.storage_key, document.file_name, document.mime_type
+    adapter = get_storage_adapter()
+    with tempfile.SpooledTemporaryFile(max_size=JOB_SPOOL_SIZE) as file:
+        for chunk in adapter.download_stream(storage_key):
+            file.write(chunk)
+        generate_previews(adapter, document_id, file, file_name, mime_type)
+
+
+@job_handler("process_blob_deletions")
+def _process_blob_deletions(payload: dict) -> None:
+    # Keys that fail stay in pending_blob_deletions with their own backoff and
+    # are retried by _maintenance(), so the job itself is done either way.
+    process_blob_deletions(get_storage_adapter(), payload["storage_keys"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=JOB_CONCURRENCY, help="jobs run at once by this worker")
+    parser.add_argument("--kind", action="append", choices=sorted(HANDLERS), help="only run this kind (repeatable)")
+    parser.add_argument("--once", action="store_true", help="exit once no job is due instead of polling")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    check_database(engine)
+    ensure_schema(engine)
+
+    # Stop claiming on SIGINT/SIGTERM and let running jobs finish.
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    processed = run_worker(args.concurrency, args.kind, once=args.once, stop=stop)
+    print(f"processed {processed} jobs")
+
+
+if __name__ == "__main__":
+    main()
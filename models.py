@@ -1,8 +1,10 @@
 import uuid
-from sqlalchemy import Column, Date, DateTime, ForeignKey, String, Text
+from datetime import datetime, timezone
+
+from sqlalchemy import JSON, BigInteger, Column, Date, DateTime, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, literal
 
 Base = declarative_base()
 
@@ -49,7 +51,81 @@ class Document(Base):
     storage_key = Column(String, nullable=False)
     file_name = Column(String, nullable=False)
     mime_type = Column(String, nullable=False)
+    # Bytes stored for the blob; NULL for rows uploaded before it was recorded.
+    size_bytes = Column(BigInteger, nullable=True)
+    # Set when the upload was optimized before storage (optimize.py).
+    original_size_bytes = Column(BigInteger, nullable=True)
+    original_storage_key = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     member = relationship("FamilyMember", back_populates="documents")
     uploader = relationship("User", back_populates="uploaded_documents")
+    previews = relationship("DocumentPreview", back_populates="document", cascade="all, delete-orphan")
+
+
+class DocumentPreview(Base):
+    __tablename__ = "document_previews"
+
+    id = uuid_column()
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    storage_key = Column(String, nullable=False, index=True)
+    mime_type = Column(String, nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    document = relationship("Document", back_populates="previews")
+
+
+class PendingBlobDeletion(Base):
+    __tablename__ = "pending_blob_deletions"
+
+    id = uuid_column()
+    storage_key = Column(String, nullable=False, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = uuid_column()
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    # Groups jobs the UI polls together, e.g. "member:<id>".
+    tag = Column(String, nullable=True, index=True)
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+def document_search_text():
+    return func.lower(
+        func.coalesce(Document.condition, "")
+        + literal(" ")
+        + func.coalesce(Document.file_name, "")
+        + literal(" ")
+        + func.coalesce(Document.description, "")
+    )
+
+
+Index("ix_documents_member_created", Document.member_id, Document.created_at.desc(), Document.id.desc())
+Index("ix_documents_member_condition", Document.member_id, Document.condition)
+Index("ix_documents_storage_key", Document.storage_key)
+Index("ix_jobs_status_next_attempt", Job.status, Job.next_attempt_at)
+# Substring search on Postgres; SQLite uses the documents_fts table created in schema.py.
+Index(
+    "ix_documents_search_trgm",
+    document_search_text().label("search_text"),
+    postgresql_using="gin",
+    postgresql_ops={"search_text": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
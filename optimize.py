@@ -0,0 +1,137 @@
+"""Optional size optimization of uploaded images before they reach storage.
+
+With IMAGE_OPTIMIZE_ENABLED, PNGs are re-deflated losslessly and JPEG photos
+whose longest edge exceeds IMAGE_MAX_DIMENSION are downscaled and re-encoded
+at IMAGE_JPEG_QUALITY. The work runs in a process pool, so a batch of phone
+photos does not hold the GIL of the Streamlit server. A result is only used
+when it is smaller than the upload; Document.original_size_bytes records the
+upload's size, and with IMAGE_KEEP_ORIGINAL the untouched file is stored too.
+
+Report the compression achieved so far with:
+
+    python optimize.py
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from config import env_bool
+from instrumentation import metrics
+from storage import as_stream, stream_size
+
+logger = logging.getLogger(__name__)
+
+IMAGE_OPTIMIZE_ENABLED = env_bool("IMAGE_OPTIMIZE_ENABLED")
+IMAGE_KEEP_ORIGINAL = env_bool("IMAGE_KEEP_ORIGINAL")
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2560"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_OPTIMIZE_MIN_BYTES = int(os.getenv("IMAGE_OPTIMIZE_MIN_BYTES", str(256 * 1024)))
+IMAGE_OPTIMIZE_WORKERS = int(os.getenv("IMAGE_OPTIMIZE_WORKERS", "2"))
+OPTIMIZABLE_TYPES = {"image/jpeg", "image/png"}
+
+
+@dataclass
+class OptimizedImage:
+    payload: bytes
+    original_size: int
+
+
+def optimize_image(payload: bytes, mime_type: str) -> bytes | None:
+    """Return a smaller encoding of the image, or None to store it unchanged."""
+    # Runs in the worker processes, which are the only place Pillow is loaded.
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(payload))
+    icc_profile = image.info.get("icc_profile")
+    buffer = io.BytesIO()
+    if mime_type == "image/png":
+        # Same pixels and mode; only the deflate stream is recompressed.
+        image.save(buffer, "PNG", optimize=True, icc_profile=icc_profile)
+    else:
+        if max(image.size) <= IMAGE_MAX_DIMENSION:
+            return None
+        image.draft("RGB", (IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.Resampling.LANCZOS)
+        image.save(
+            buffer, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True, icc_profile=icc_profile
+        )
+    optimized = buffer.getvalue()
+    return optimized if len(optimized) < len(payload) else None
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _optimizer_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking the threaded Streamlit server can copy held locks into
+            # the child, so workers start from a fresh interpreter instead.
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, IMAGE_OPTIMIZE_WORKERS), mp_context=multiprocessing.get_context("spawn")
+            )
+    return _pool
+
+
+def optimize_images(files: list[tuple[BinaryIO | bytes, str]]) -> list[OptimizedImage | None]:
+    """Optimize the (file, mime_type) pairs in parallel; None where a file is stored as uploaded."""
+    results: list[OptimizedImage | None] = [None] * len(files)
+    if not IMAGE_OPTIMIZE_ENABLED:
+        return results
+    futures = {}
+    for index, (file, mime_type) in enumerate(files):
+        if mime_type not in OPTIMIZABLE_TYPES:
+            continue
+        stream = as_stream(file)
+        size = stream_size(stream)
+        if size is not None and size < IMAGE_OPTIMIZE_MIN_BYTES:
+            continue
+        payload = stream.read()
+        futures[index] = (len(payload), _optimizer_pool().submit(optimize_image, payload, mime_type))
+
+    for index, (original_size, future) in futures.items():
+        try:
+            optimized = future.result()
+        except Exception:
+            logger.exception("Image optimization failed; storing upload %s unchanged", index)
+            metrics.increment("image_optimize_files_total", result="failed")
+            continue
+        if optimized is None:
+            metrics.increment("image_optimize_files_total", result="unchanged")
+            continue
+        metrics.increment("image_optimize_files_total", result="optimized")
+        metrics.increment("image_optimize_bytes_total", original_size, stage="original")
+        metrics.increment("image_optimize_bytes_total", len(optimized), stage="stored")
+        results[index] = OptimizedImage(optimized, original_size)
+    return results
+
+
+def main():
+    # Imported here so worker processes, which import this module to find
+    # optimize_image, do not build a database engine.
+    from db import get_db_session
+    from queries import image_compression_stats
+
+    with get_db_session() as db:
+        documents, original_bytes, stored_bytes = image_compression_stats(db)
+    if not documents:
+        print("no optimized images stored yet")
+        return
+    print(
+        f"{documents} optimized images: {original_bytes / 1_000_000:.1f} MB uploaded, "
+        f"{stored_bytes / 1_000_000:.1f} MB stored; ratio {original_bytes / max(stored_bytes, 1):.2f}:1, "
+        f"{100 * (1 - stored_bytes / original_bytes):.1f}% saved"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import io
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO
+
+from sqlalchemy import select
+
+from blobs import release_blobs
+from db import get_db_session
+from models import Document, DocumentPreview
+from storage import StorageAdapter, as_stream
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# kind -> longest edge in pixels
+PREVIEW_SIZES = {
+    "thumbnail": int(os.getenv("PREVIEW_THUMBNAIL_SIZE", "320")),
+    "preview": int(os.getenv("PREVIEW_LARGE_SIZE", "1280")),
+}
+PREVIEW_JPEG_QUALITY = int(os.getenv("PREVIEW_JPEG_QUALITY", "75"))
+PREVIEW_PDF_DPI = 110
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+
+_preview_pool = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="previews")
+
+
+def has_previews(mime_type: str) -> bool:
+    return mime_type == "application/pdf" or mime_type.startswith("image/")
+
+
+def _open_source_image(file: BinaryIO, mime_type: str) -> "Image.Image | None":
+    # Imaging libraries load in the preview workers, not at app startup.
+    from PIL import Image, ImageOps
+
+    if mime_type == "application/pdf":
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(file)
+        try:
+            if len(pdf) == 0:
+                return None
+            return pdf[0].render(scale=PREVIEW_PDF_DPI / 72).to_pil()
+        finally:
+            pdf.close()
+    if mime_type.startswith("image/"):
+        image = Image.open(file)
+        # Scale while decoding where the format supports it (JPEG) to avoid
+        # materializing full-resolution phone photos.
+        image.draft("RGB", (max(PREVIEW_SIZES.values()),) * 2)
+        return ImageOps.exif_transpose(image)
+    return None
+
+
+def render_previews(file: BinaryIO | bytes, mime_type: str) -> dict[str, tuple[bytes, int, int]]:
+    """Return JPEG bytes and dimensions for each preview kind, largest first."""
+    source = _open_source_image(as_stream(file), mime_type)
+    if source is None:
+        return {}
+    rendered = {}
+    image = source.convert("RGB")
+    for kind, size in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=PREVIEW_JPEG_QUALITY, optimize=True, progressive=True)
+        rendered[kind] = (buffer.getvalue(), image.width, image.height)
+    return rendered
+
+
+def generate_previews(
+    adapter: StorageAdapter,
+    document_id: uuid.UUID,
+    file: BinaryIO | bytes,
+    filename: str,
+    mime_type: str,
+) -> list[DocumentPreview]:
+    stem = os.path.splitext(filename)[0]
+    previews = []
+    for kind, (payload, width, height) in render_previews(file, mime_type).items():
+        storage_key = adapter.upload(payload, f"{stem}.{kind}.jpg", "image/jpeg")
+        previews.append(
+            DocumentPreview(
+                document_id=document_id,
+                kind=kind,
+                storage_key=storage_key,
+                mime_type="image/jpeg",
+                width=width,
+                height=height,
+            )
+        )
+    if not previews:
+        return []
+    try:
+        with get_db_session() as db:
+            db.add_all(previews)
+            # Insert first, then check: on SQLite, which does not enforce the
+            # foreign key here, the insert takes the write lock, so the
+            # document cannot be deleted between the check and the commit.
+            db.flush()
+            document_exists = db.execute(select(Document.id).where(Document.id == document_id)).first()
+            if document_exists:
+                db.commit()
+            else:
+                db.rollback()
+    except Exception:
+        release_blobs(adapter, [preview.storage_key for preview in previews])
+        raise
+    if not document_exists:
+        # Deleted while its previews were rendering.
+        release_blobs(adapter, [preview.storage_key for preview in previews])
+        return []
+    return previews
+
+
+def _generate_logged(adapter, document_id, file, filename, mime_type, on_done) -> None:
+    try:
+        if generate_previews(adapter, document_id, file, filename, mime_type) and on_done:
+            on_done()
+    except Exception:
+        logger.exception("Preview generation failed for document %s", document_id)
+
+
+def schedule_previews(
+    adapter: StorageAdapter,
+    sources: list[tuple[uuid.UUID, BinaryIO | bytes, str, str]],
+    on_done=None,
+) -> None:
+    """Render (document_id, file, filename, mime_type) sources in the background.
+
+    on_done runs after each document's previews are stored.
+    """
+    for document_id, file, filename, mime_type in sources:
+        _preview_pool.submit(_generate_logged, adapter, document_id, file, filename, mime_type, on_done)
@@ -0,0 +1,226 @@
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_, case, func, or_, select, text
+from sqlalchemy.orm import Session, selectinload
+
+from models import Document, FamilyMember, User, document_search_text
+from schema import has_document_fts
+
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "25"))
+MEMBER_TOP_CONDITIONS = int(os.getenv("MEMBER_TOP_CONDITIONS", "3"))
+
+
+@dataclass(frozen=True)
+class DocumentFilters:
+    search_text: str = ""
+    condition: str | None = None
+    mime_type: str | None = None
+    start_date: date | None = None
+    end_date: date | None = None
+
+
+@dataclass(frozen=True)
+class DocumentFacets:
+    conditions: list[str]
+    mime_types: list[str]
+    min_date: date | None
+    max_date: date | None
+
+
+@dataclass(frozen=True)
+class DocumentCursor:
+    created_at: datetime
+    id: uuid.UUID
+
+
+@dataclass(frozen=True)
+class MemberStats:
+    documents: int = 0
+    latest_doc_date: date | None = None
+    # None while any of the member's documents has no recorded size; see
+    # backfill_sizes.py.
+    total_bytes: int | None = 0
+    top_conditions: tuple[str, ...] = ()
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def user_by_email(db: Session, email: str) -> User | None:
+    """The user whose email matches case-insensitively.
+
+    Accounts created before emails were normalized may differ only by case;
+    an exact match on what was typed wins, then the oldest account.
+    """
+    return db.execute(
+        select(User)
+        .where(func.lower(User.email) == normalize_email(email))
+        .order_by(case((User.email == email.strip(), 0), else_=1), User.created_at)
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def list_family_members(db: Session) -> list[FamilyMember]:
+    return db.execute(select(FamilyMember).order_by(FamilyMember.created_at.desc())).scalars().all()
+
+
+def member_stats(db: Session) -> dict[uuid.UUID, MemberStats]:
+    """Per-member document aggregates for every member, in two grouped queries.
+
+    Members without documents are absent; callers default to MemberStats().
+    total_bytes is None for members with rows stored before size_bytes was
+    recorded, until backfill_sizes.py has run.
+    """
+    totals = db.execute(
+        select(
+            Document.member_id,
+            func.count(Document.id),
+            func.max(Document.doc_date),
+            func.coalesce(func.sum(Document.size_bytes), 0),
+            func.count(Document.size_bytes),
+        ).group_by(Document.member_id)
+    ).all()
+    # Served from the (member_id, condition) index; ranked per member in SQL
+    # so only the top conditions come back.
+    condition_counts = (
+        select(
+            Document.member_id,
+            Document.condition,
+            func.row_number()
+            .over(
+                partition_by=Document.member_id,
+                order_by=(func.count(Document.id).desc(), Document.condition),
+            )
+            .label("rank"),
+        )
+        .group_by(Document.member_id, Document.condition)
+        .subquery()
+    )
+    top_conditions: dict[uuid.UUID, list[str]] = {}
+    for member_id, condition in db.execute(
+        select(condition_counts.c.member_id, condition_counts.c.condition)
+        .where(condition_counts.c.rank <= MEMBER_TOP_CONDITIONS)
+        .order_by(condition_counts.c.member_id, condition_counts.c.rank)
+    ):
+        top_conditions.setdefault(member_id, []).append(condition)
+    return {
+        member_id: MemberStats(
+            documents=count,
+            latest_doc_date=latest,
+            total_bytes=int(total_bytes) if sized == count else None,
+            top_conditions=tuple(top_conditions.get(member_id, ())),
+        )
+        for member_id, count, latest, total_bytes, sized in totals
+    }
+
+
+def image_compression_stats(db: Session) -> tuple[int, int, int]:
+    """(documents, bytes uploaded, bytes stored) over documents optimized before storage."""
+    documents, original_bytes, stored_bytes = db.execute(
+        select(
+            func.count(Document.id),
+            func.coalesce(func.sum(Document.original_size_bytes), 0),
+            func.coalesce(func.sum(Document.size_bytes), 0),
+        ).where(Document.original_size_bytes.is_not(None))
+    ).one()
+    return documents, int(original_bytes), int(stored_bytes)
+
+
+def document_facets(db: Session, member_id: uuid.UUID) -> DocumentFacets:
+    in_member = Document.member_id == member_id
+    conditions = db.execute(
+        select(Document.condition).where(in_member).distinct().order_by(Document.condition)
+    ).scalars().all()
+    mime_types = db.execute(
+        select(Document.mime_type).where(in_member).distinct().order_by(Document.mime_type)
+    ).scalars().all()
+    min_created, max_created = db.execute(
+        select(func.min(Document.created_at), func.max(Document.created_at)).where(in_member)
+    ).one()
+    return DocumentFacets(
+        conditions=[condition for condition in conditions if condition],
+        mime_types=[mime_type for mime_type in mime_types if mime_type],
+        min_date=min_created.date() if min_created else None,
+        max_date=max_created.date() if max_created else None,
+    )
+
+
+def _created_at_bounds(db: Session):
+    # SQLite stores CURRENT_TIMESTAMP as second-precision text, while bound
+    # datetimes carry microseconds; normalize both sides so equality and range
+    # comparisons line up.
+    if db.get_bind().dialect.name == "sqlite":
+        return func.datetime(Document.created_at), lambda value: func.datetime(value.isoformat(sep=" "))
+    return Document.created_at, lambda value: value
+
+
+def _search_clause(db: Session, search_text: str):
+    # The trigram tokenizer needs at least three characters to match.
+    if len(search_text) >= 3 and has_document_fts(db.connection()):
+        phrase = '"' + search_text.replace('"', '""') + '"'
+        return text("documents.rowid IN (SELECT rowid FROM documents_fts WHERE documents_fts MATCH :phrase)").bindparams(
+            phrase=phrase
+        )
+    return document_search_text().contains(search_text.lower(), autoescape=True)
+
+
+def list_documents(
+    db: Session,
+    member_id: uuid.UUID,
+    filters: DocumentFilters,
+    after: DocumentCursor | None = None,
+    limit: int = DOCUMENTS_PAGE_SIZE,
+) -> tuple[list[Document], DocumentCursor | None]:
+    """Return one page of a member's documents, newest first, and the cursor for the next page."""
+    created_at, bound = _created_at_bounds(db)
+    statement = select(Document).where(Document.member_id == member_id)
+    if filters.condition:
+        statement = statement.where(Document.condition == filters.condition)
+    if filters.mime_type:
+        statement = statement.where(Document.mime_type == filters.mime_type)
+    if filters.start_date:
+        statement = statement.where(created_at >= bound(datetime.combine(filters.start_date, time.min)))
+    if filters.end_date:
+        statement = statement.where(
+            created_at < bound(datetime.combine(filters.end_date + timedelta(days=1), time.min))
+        )
+    if filters.search_text:
+        statement = statement.where(_search_clause(db, filters.search_text))
+    if after is not None:
+        statement = statement.where(
+            or_(
+                created_at < bound(after.created_at),
+                and_(created_at == bound(after.created_at), Document.id < after.id),
+            )
+        )
+    statement = (
+        statement.options(selectinload(Document.previews))
+        .order_by(Document.created_at.desc(), Document.id.desc())
+        .limit(limit + 1)
+    )
+
+    documents = db.execute(statement).scalars().all()
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = DocumentCursor(documents[-1].created_at, documents[-1].id)
+    return documents, next_cursor
+
+
+def documents_created_since(
+    db: Session,
+    member_ids: list[uuid.UUID] | None = None,
+    since: datetime | None = None,
+) -> list[Document]:
+    """Documents created at or after `since`, oldest first."""
+    created_at, bound = _created_at_bounds(db)
+    statement = select(Document)
+    if member_ids is not None:
+        statement = statement.where(Document.member_id.in_(member_ids))
+    if since is not None:
+        statement = statement.where(created_at >= bound(since))
+    return db.execute(statement.order_by(Document.created_at, Document.id)).scalars().all()
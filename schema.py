@@ -0,0 +1,184 @@
+import logging
+import threading
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+from models import Base
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+        condition, file_name, description,
+        content='documents', content_rowid='rowid', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts(rowid, condition, file_name, description)
+        VALUES (new.rowid, new.condition, new.file_name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, condition, file_name, description)
+        VALUES ('delete', old.rowid, old.condition, old.file_name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, condition, file_name, description)
+        VALUES ('delete', old.rowid, old.condition, old.file_name, old.description);
+        INSERT INTO documents_fts(rowid, condition, file_name, description)
+        VALUES (new.rowid, new.condition, new.file_name, new.description);
+    END
+    """,
+]
+
+
+_fts_available: dict[Engine, bool] = {}
+
+
+def _ensure_sqlite_fts(connection) -> None:
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'")
+    ).first()
+    try:
+        for statement in SQLITE_FTS_DDL:
+            connection.execute(text(statement))
+    except Exception:
+        # SQLite builds without FTS5/trigram fall back to LIKE scans in queries.py.
+        return
+    if not exists:
+        connection.execute(text("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')"))
+
+
+def has_document_fts(connection: Connection) -> bool:
+    if connection.dialect.name != "sqlite":
+        return False
+    if connection.engine not in _fts_available:
+        _fts_available[connection.engine] = inspect(connection).has_table("documents_fts")
+    return _fts_available[connection.engine]
+
+
+def _add_missing_columns(connection: Connection) -> None:
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            # New columns must be nullable or carry a server default.
+            column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}"))
+
+
+def _sync_schema(connection: Connection) -> None:
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    Base.metadata.create_all(bind=connection)
+    # create_all skips tables that already exist, so columns and indexes added
+    # later are created here for existing databases.
+    _add_missing_columns(connection)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    if connection.dialect.name == "sqlite":
+        _ensure_sqlite_fts(connection)
+
+
+def _unique_lower_email(connection: Connection) -> None:
+    """Stop new accounts whose email differs from an existing one only by case.
+
+    Not declared on the model: _sync_schema would then fail to start an
+    existing database that already holds such accounts.
+    """
+    duplicates = connection.execute(
+        text("SELECT lower(email) FROM users GROUP BY lower(email) HAVING count(*) > 1")
+    ).scalars().all()
+    if duplicates:
+        logger.warning(
+            "Not creating ux_users_email_lower: emails differing only by case exist for %s", ", ".join(duplicates)
+        )
+        return
+    connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_users_email_lower ON users (lower(email))"))
+
+
+# (version, data migration run after the schema sync). Bump the version
+# whenever models change so existing databases are brought up to date.
+MIGRATIONS = [
+    (1, None),
+    (2, None),  # documents.size_bytes
+    (3, None),  # documents.original_size_bytes, original_storage_key
+    (4, None),  # jobs
+    (5, _unique_lower_email),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+schema_versions = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+# Arbitrary constant naming the Postgres advisory lock held while upgrading.
+SCHEMA_LOCK_KEY = 0x66616D7265637301
+
+_ready: set[Engine] = set()
+_ready_lock = threading.Lock()
+
+
+def current_schema_version(connection: Connection) -> int:
+    if not inspect(connection).has_table(schema_versions.name):
+        return 0
+    return connection.execute(select(func.max(schema_versions.c.version))).scalar() or 0
+
+
+def _lock_schema(connection: Connection) -> None:
+    """Hold off other processes' upgrades until this transaction ends."""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+    elif connection.dialect.name == "sqlite":
+        # pysqlite only opens a transaction before DML, so DDL would otherwise
+        # run unlocked; other writers wait out busy_timeout on this lock.
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def ensure_schema(engine: Engine) -> None:
+    """Bring the database to SCHEMA_VERSION once per process.
+
+    Streamlit re-executes app.py on every rerun, so after the first check this
+    is an in-memory set lookup; the first check itself is a single version
+    query when the database is already current. Cold starts of several
+    processes take a database lock and re-read the version, so only the
+    first one upgrades.
+    """
+    if engine in _ready:
+        return
+    with _ready_lock:
+        if engine in _ready:
+            return
+        with engine.begin() as connection:
+            version = current_schema_version(connection)
+            if version < SCHEMA_VERSION:
+                _lock_schema(connection)
+                # Another process may have upgraded while this one waited.
+                version = current_schema_version(connection)
+            if version < SCHEMA_VERSION:
+                _sync_schema(connection)
+                schema_versions.create(connection, checkfirst=True)
+                for migration_version, migrate in MIGRATIONS:
+                    if migration_version <= version:
+                        continue
+                    if migrate is not None:
+                        migrate(connection)
+                    connection.execute(insert(schema_versions).values(version=migration_version))
+        _fts_available.pop(engine, None)
+        _ready.add(engine)
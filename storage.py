@@ -1,81 +1,803 @@
+import base64
+import hashlib
+import hmac
+import io
+import json
 import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Protocol
+from functools import lru_cache
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterator, Protocol
+from urllib.parse import quote
 
-from supabase import create_client
+from config import env_bool
+from instrumentation import INSTRUMENTATION_ENABLED, record_storage_call
+
+if TYPE_CHECKING:
+    from storage3 import SyncStorageClient
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def as_stream(file: BinaryIO | bytes) -> BinaryIO:
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        return io.BytesIO(file)
+    file.seek(0)
+    return file
+
+
+def stream_size(stream: BinaryIO) -> int | None:
+    try:
+        position = stream.tell()
+        size = stream.seek(0, io.SEEK_END)
+        stream.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return size - position
+
+
+def iter_chunks(stream: BinaryIO, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    while chunk := stream.read(chunk_size):
+        yield chunk
+
+
+# Called with (bytes sent, total bytes or None) as an upload progresses.
+ProgressCallback = Callable[[int, int | None], None]
+
+
+def reporting_chunks(chunks: Iterator[bytes], progress: ProgressCallback | None, total: int | None) -> Iterator[bytes]:
+    sent = 0
+    for chunk in chunks:
+        yield chunk
+        sent += len(chunk)
+        if progress:
+            progress(sent, total)
+
+
+def hash_stream(stream: BinaryIO) -> tuple[BinaryIO, str, int]:
+    """Return a rewound stream with the SHA-256 hex digest and size of its contents."""
+    digest = hashlib.sha256()
+    size = 0
+    if stream.seekable():
+        for chunk in iter_chunks(stream):
+            digest.update(chunk)
+            size += len(chunk)
+        stream.seek(0)
+        return stream, digest.hexdigest(), size
+    spooled = tempfile.SpooledTemporaryFile(max_size=16 * UPLOAD_CHUNK_SIZE)
+    for chunk in iter_chunks(stream):
+        digest.update(chunk)
+        size += len(chunk)
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled, digest.hexdigest(), size
+
+
+def content_key(digest: str) -> str:
+    return f"cas/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def is_content_key(storage_key: str) -> bool:
+    return storage_key.startswith("cas/")
 
 
 class StorageAdapter(Protocol):
-    def upload(self, file_bytes: bytes, filename: str, content_type: str) -> str:
+    def upload(
+        self, file: BinaryIO | bytes, filename: str, content_type: str, progress: ProgressCallback | None = None
+    ) -> str:
         raise NotImplementedError
 
     def get_signed_url(self, storage_key: str, expires_in: int) -> str:
         raise NotImplementedError
 
+    def get_signed_urls(self, storage_keys: list[str], expires_in: int) -> dict[str, str]:
+        raise NotImplementedError
+
     def delete(self, storage_key: str) -> None:
         raise NotImplementedError
 
+    def delete_many(self, storage_keys: list[str]) -> list[str]:
+        """Delete the keys in batches and return those that could not be deleted."""
+        raise NotImplementedError
+
+    def upload_to(
+        self,
+        storage_key: str,
+        file: BinaryIO | bytes,
+        content_type: str,
+        progress: ProgressCallback | None = None,
+    ) -> None:
+        raise NotImplementedError
+
+    def exists(self, storage_key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, storage_key: str) -> int:
+        raise NotImplementedError
+
+    def download_stream(self, storage_key: str) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def copy(self, source_key: str, target_key: str) -> None:
+        raise NotImplementedError
+
+
+# Files above the threshold are sent in chunks whose progress is persisted, so
+# a failed upload resumes from the last acknowledged offset. Supabase's TUS
+# endpoint currently requires 6 MiB chunks.
+RESUMABLE_UPLOAD_THRESHOLD = int(os.getenv("UPLOAD_RESUMABLE_THRESHOLD", str(6 * 1024 * 1024)))
+RESUMABLE_CHUNK_SIZE = int(os.getenv("UPLOAD_RESUMABLE_CHUNK_SIZE", str(6 * 1024 * 1024)))
+RESUMABLE_RETRIES = int(os.getenv("UPLOAD_RESUMABLE_RETRIES", "5"))
+
 
 @dataclass
+class UploadState:
+    storage_key: str
+    # TUS upload URL for Supabase, partial file path for local storage.
+    location: str | None = None
+    offset: int = 0
+    # None when another upload of the same content already holds the saved state.
+    fingerprint: str | None = None
+
+
+class UploadStateStore:
+    """Progress of in-flight resumable uploads, one JSON file per upload fingerprint.
+
+    A state is claimed for the duration of an upload, so two concurrent
+    uploads of the same content in one process never share a target, and is
+    removed once the upload completes.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._claimed: set[str] = set()
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(fingerprint.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, fingerprint: str) -> UploadState | None:
+        try:
+            with open(self._path(fingerprint), encoding="utf-8") as handle:
+                return UploadState(**json.load(handle), fingerprint=fingerprint)
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def save(self, state: UploadState) -> None:
+        if state.fingerprint is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(state.fingerprint)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+            json.dump({"storage_key": state.storage_key, "location": state.location, "offset": state.offset}, handle)
+        os.replace(f"{path}.tmp", path)
+
+    @contextmanager
+    def claim(self, fingerprint: str, storage_key: str) -> Iterator[UploadState]:
+        with self._lock:
+            shared = fingerprint in self._claimed
+            self._claimed.add(fingerprint)
+        if shared:
+            yield UploadState(storage_key)
+            return
+        try:
+            yield self._load(fingerprint) or UploadState(storage_key, fingerprint=fingerprint)
+            # Reached only when the upload completed.
+            try:
+                os.remove(self._path(fingerprint))
+            except FileNotFoundError:
+                pass
+        finally:
+            with self._lock:
+                self._claimed.discard(fingerprint)
+
+
+upload_states = UploadStateStore(
+    os.getenv("UPLOAD_STATE_DIR", os.path.join(tempfile.gettempdir(), "family-records-uploads"))
+)
+
+
+def upload_fingerprint(scope: str, stream: BinaryIO, storage_key: str | None) -> tuple[BinaryIO, str, int]:
+    """Identify an upload by destination and content so a retry finds its saved state."""
+    if storage_key and is_content_key(storage_key):
+        return stream, f"{scope}:{storage_key}", stream_size(stream)
+    stream, digest, size = hash_stream(stream)
+    return stream, f"{scope}:{storage_key or ''}:{digest}:{size}", size
+
+
+def _store_blob(adapter, storage_key: str | None, new_key: Callable[[], str], file, content_type, progress) -> str:
+    """Upload through adapter._write_single, or _write_resumable above the size threshold.
+
+    With storage_key None, a retry of an interrupted upload reuses the key it
+    was writing to; otherwise new_key() names the blob.
+    """
+    stream = as_stream(file)
+    size = stream_size(stream)
+    if size is None or size <= RESUMABLE_UPLOAD_THRESHOLD:
+        storage_key = storage_key or new_key()
+        adapter._write_single(storage_key, stream, size, content_type, progress)
+        return storage_key
+    stream, fingerprint, size = upload_fingerprint(adapter._scope, stream, storage_key)
+    with upload_states.claim(fingerprint, storage_key or new_key()) as state:
+        adapter._write_resumable(state, stream, size, content_type, progress)
+    return state.storage_key
+
+
+@dataclass(frozen=True)
+class HttpPoolConfig:
+    max_connections: int = 10
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    timeout: float = 20.0
+
+    @classmethod
+    def from_env(cls) -> "HttpPoolConfig":
+        return cls(
+            max_connections=int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", cls.max_keepalive_connections)),
+            keepalive_expiry=float(os.getenv("SUPABASE_HTTP_KEEPALIVE_EXPIRY", cls.keepalive_expiry)),
+            timeout=float(os.getenv("SUPABASE_HTTP_TIMEOUT", cls.timeout)),
+        )
+
+
+@lru_cache(maxsize=None)
+def _pooled_client_class():
+    # The storage SDK and httpx are imported on first use so processes that
+    # never touch Supabase (local storage, CLI tools) skip their import cost.
+    import httpx
+    from storage3 import SyncStorageClient
+    from storage3.utils import SyncClient
+
+    class PooledStorageClient(SyncStorageClient):
+        """Supabase storage client whose HTTP session uses a bounded keep-alive pool."""
+
+        def __init__(self, url: str, api_key: str, pool: HttpPoolConfig):
+            self.pool = pool
+            headers = {"apiKey": api_key, "Authorization": f"Bearer {api_key}"}
+            super().__init__(url, headers, pool.timeout)
+
+        def _create_session(self, base_url, headers, timeout, verify=True):
+            return SyncClient(
+                base_url=base_url,
+                headers=headers,
+                timeout=timeout,
+                verify=bool(verify),
+                follow_redirects=True,
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.pool.max_connections,
+                    max_keepalive_connections=self.pool.max_keepalive_connections,
+                    keepalive_expiry=self.pool.keepalive_expiry,
+                ),
+            )
+
+    return PooledStorageClient
+
+
+class SupabaseClientRegistry:
+    """Process-wide storage clients keyed by (url, key, bucket).
+
+    Streamlit runs each session's script on its own thread, so lookups are
+    guarded by a lock. A client is rebuilt when the pool settings change, and
+    any client for the same url/bucket under an older key is dropped so that
+    rotated credentials take effect on the next call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: dict[tuple[str, str, str], "SyncStorageClient"] = {}
+
+    def get(self, url: str, api_key: str, bucket: str) -> "SyncStorageClient":
+        pool = HttpPoolConfig.from_env()
+        cache_key = (url, api_key, bucket)
+        with self._lock:
+            client = self._clients.get(cache_key)
+            if client is not None and client.pool == pool:
+                return client
+            # Stale clients are dropped rather than closed: another session
+            # thread may still be mid-request on them.
+            for stale_key in [key for key in self._clients if key[0] == url and key[2] == bucket]:
+                del self._clients[stale_key]
+            client = _pooled_client_class()(f"{url.rstrip('/')}/storage/v1", api_key, pool)
+            self._clients[cache_key] = client
+            return client
+
+    def clear(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.aclose()
+
+
+supabase_clients = SupabaseClientRegistry()
+
+SIGN_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 500
+LOCAL_DELETE_WORKERS = 8
+
+
+@dataclass(frozen=True)
 class SupabaseStorageAdapter:
     url: str
     anon_key: str
     bucket: str
 
-    def _client(self):
-        return create_client(self.url, self.anon_key)
+    def _client(self) -> "SyncStorageClient":
+        return supabase_clients.get(self.url, self.anon_key, self.bucket)
 
-    def upload(self, file_bytes: bytes, filename: str, content_type: str) -> str:
-        storage_key = f"uploads/{uuid.uuid4()}/{filename}"
+    @property
+    def _scope(self) -> str:
+        return f"supabase:{self.url}:{self.bucket}"
+
+    def upload(
+        self, file: BinaryIO | bytes, filename: str, content_type: str, progress: ProgressCallback | None = None
+    ) -> str:
+        return _store_blob(self, None, lambda: f"uploads/{uuid.uuid4()}/{filename}", file, content_type, progress)
+
+    def upload_to(
+        self,
+        storage_key: str,
+        file: BinaryIO | bytes,
+        content_type: str,
+        progress: ProgressCallback | None = None,
+    ) -> None:
+        _store_blob(self, storage_key, lambda: storage_key, file, content_type, progress)
+
+    def _write_single(self, storage_key, stream: BinaryIO, size: int | None, content_type: str, progress) -> None:
+        headers = {"content-type": content_type, "x-upsert": "true"}
+        if size is not None:
+            headers["content-length"] = str(size)
+        # Raw-body upload on the shared session so the file is streamed in
+        # chunks instead of being materialized into a multipart payload.
         client = self._client()
-        client.storage.from_(self.bucket).upload(
-            storage_key,
-            file_bytes,
-            {
-                "content-type": content_type,
-                "x-upsert": "true",
-            },
+        response = client.session.post(
+            f"object/{self.bucket}/{storage_key}",
+            content=reporting_chunks(iter_chunks(stream), progress, size),
+            headers=headers,
         )
-        return storage_key
+        response.raise_for_status()
+
+    def _write_resumable(self, state: UploadState, stream: BinaryIO, size: int, content_type: str, progress) -> None:
+        """TUS upload: create once, then PATCH chunks, re-reading the offset after a failure."""
+        import httpx
+
+        session = self._client().session
+        tus = {"Tus-Resumable": "1.0.0"}
+        for attempt in range(RESUMABLE_RETRIES + 1):
+            try:
+                if state.location:
+                    response = session.head(state.location, headers=tus)
+                    if response.status_code in (404, 410):
+                        state.location, state.offset = None, 0
+                    else:
+                        response.raise_for_status()
+                        state.offset = int(response.headers["Upload-Offset"])
+                if not state.location:
+                    metadata = {
+                        "bucketName": self.bucket,
+                        "objectName": state.storage_key,
+                        "contentType": content_type,
+                        "cacheControl": "3600",
+                    }
+                    response = session.post(
+                        "upload/resumable",
+                        headers={
+                            **tus,
+                            "Upload-Length": str(size),
+                            "Upload-Metadata": ",".join(
+                                f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}"
+                                for key, value in metadata.items()
+                            ),
+                            "x-upsert": "true",
+                        },
+                    )
+                    response.raise_for_status()
+                    state.location, state.offset = response.headers["Location"], 0
+                    upload_states.save(state)
+
+                stream.seek(state.offset)
+                while state.offset < size:
+                    response = session.patch(
+                        state.location,
+                        content=stream.read(RESUMABLE_CHUNK_SIZE),
+                        headers={
+                            **tus,
+                            "Upload-Offset": str(state.offset),
+                            "Content-Type": "application/offset+octet-stream",
+                        },
+                    )
+                    response.raise_for_status()
+                    state.offset = int(response.headers["Upload-Offset"])
+                    upload_states.save(state)
+                    if progress:
+                        progress(state.offset, size)
+                return
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                # 409 is an offset mismatch and 423 a locked upload: both are
+                # resolved by re-reading the offset on the next attempt.
+                status = exc.response.status_code if isinstance(exc, httpx.HTTPStatusError) else None
+                if (status is not None and status < 500 and status not in (409, 423)) or attempt == RESUMABLE_RETRIES:
+                    raise
+                time.sleep(min(2**attempt, 30))
+
+    def exists(self, storage_key: str) -> bool:
+        response = self._client().session.head(f"object/authenticated/{self.bucket}/{storage_key}")
+        if response.status_code in (400, 404):
+            return False
+        response.raise_for_status()
+        return True
+
+    def size(self, storage_key: str) -> int:
+        response = self._client().session.head(f"object/authenticated/{self.bucket}/{storage_key}")
+        response.raise_for_status()
+        return int(response.headers["content-length"])
+
+    def download_stream(self, storage_key: str) -> Iterator[bytes]:
+        with self._client().session.stream("GET", f"object/authenticated/{self.bucket}/{storage_key}") as response:
+            response.raise_for_status()
+            yield from response.iter_bytes(UPLOAD_CHUNK_SIZE)
+
+    def copy(self, source_key: str, target_key: str) -> None:
+        self._client().from_(self.bucket).copy(source_key, target_key)
 
     def get_signed_url(self, storage_key: str, expires_in: int) -> str:
         client = self._client()
-        result = client.storage.from_(self.bucket).create_signed_url(storage_key, expires_in)
+        result = client.from_(self.bucket).create_signed_url(storage_key, expires_in)
         return result.get("signedURL") or ""
 
+    def get_signed_urls(self, storage_keys: list[str], expires_in: int) -> dict[str, str]:
+        # Posted on the shared session rather than through create_signed_urls,
+        # which fails outright when any single path in the batch cannot be signed.
+        client = self._client()
+        signed = {}
+        for start in range(0, len(storage_keys), SIGN_BATCH_SIZE):
+            batch = storage_keys[start : start + SIGN_BATCH_SIZE]
+            response = client.session.post(
+                f"object/sign/{self.bucket}",
+                json={"paths": batch, "expiresIn": expires_in},
+            )
+            response.raise_for_status()
+            for item in response.json():
+                path = item.get("signedURL")
+                signed[item.get("path")] = f"{client.session.base_url}{path.lstrip('/')}" if path else ""
+        return {storage_key: signed.get(storage_key, "") for storage_key in storage_keys}
+
     def delete(self, storage_key: str) -> None:
         client = self._client()
-        client.storage.from_(self.bucket).remove([storage_key])
+        client.from_(self.bucket).remove([storage_key])
 
+    def delete_many(self, storage_keys: list[str]) -> list[str]:
+        bucket = self._client().from_(self.bucket)
+        failed = []
+        for start in range(0, len(storage_keys), DELETE_BATCH_SIZE):
+            batch = storage_keys[start : start + DELETE_BATCH_SIZE]
+            try:
+                bucket.remove(batch)
+            except Exception:
+                failed.extend(batch)
+        return failed
 
-@dataclass
+
+def sign_local_key(secret: str, storage_key: str, expires: int) -> str:
+    digest = hmac.new(secret.encode("utf-8"), f"{storage_key}\n{expires}".encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def verify_local_token(secret: str, storage_key: str, expires: int, token: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_local_key(secret, storage_key, expires), token)
+
+
+@dataclass(frozen=True)
 class LocalStorageAdapter:
     base_path: str
+    public_url: str | None = None
+    signing_secret: str | None = None
 
-    def upload(self, file_bytes: bytes, filename: str, content_type: str) -> str:
-        os.makedirs(self.base_path, exist_ok=True)
-        storage_key = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(self.base_path, storage_key)
-        with open(file_path, "wb") as file_handle:
-            file_handle.write(file_bytes)
-        return storage_key
+    def local_path(self, storage_key: str) -> str:
+        base_path = os.path.abspath(self.base_path)
+        file_path = os.path.abspath(os.path.join(base_path, storage_key))
+        if not file_path.startswith(base_path + os.sep):
+            raise ValueError(f"Storage key escapes the storage directory: {storage_key}")
+        return file_path
+
+    @property
+    def _scope(self) -> str:
+        return f"local:{os.path.abspath(self.base_path)}"
+
+    def upload(
+        self, file: BinaryIO | bytes, filename: str, content_type: str, progress: ProgressCallback | None = None
+    ) -> str:
+        def new_key() -> str:
+            # Two levels of hashed subdirectories keep any one directory small.
+            blob_id = uuid.uuid4().hex
+            return f"{blob_id[:2]}/{blob_id[2:4]}/{blob_id}_{filename}"
+
+        return _store_blob(self, None, new_key, file, content_type, progress)
+
+    def upload_to(
+        self,
+        storage_key: str,
+        file: BinaryIO | bytes,
+        content_type: str,
+        progress: ProgressCallback | None = None,
+    ) -> None:
+        _store_blob(self, storage_key, lambda: storage_key, file, content_type, progress)
+
+    def _write_single(self, storage_key, stream: BinaryIO, size: int | None, content_type: str, progress) -> None:
+        file_path = self.local_path(storage_key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Write beside the target and rename so a partial file never appears
+        # under its final key.
+        partial_path = f"{file_path}.{uuid.uuid4().hex}.partial"
+        with open(partial_path, "wb") as file_handle:
+            for chunk in reporting_chunks(iter_chunks(stream), progress, size):
+                file_handle.write(chunk)
+        os.replace(partial_path, file_path)
+
+    def _write_resumable(self, state: UploadState, stream: BinaryIO, size: int, content_type: str, progress) -> None:
+        file_path = self.local_path(state.storage_key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        resumable = (
+            state.location is not None
+            and state.location.startswith(f"{file_path}.")
+            and os.path.exists(state.location)
+            and os.path.getsize(state.location) >= state.offset
+        )
+        if not resumable:
+            state.location, state.offset = f"{file_path}.{uuid.uuid4().hex}.partial", 0
+        with open(state.location, "r+b" if resumable else "wb") as file_handle:
+            file_handle.truncate(state.offset)
+            file_handle.seek(state.offset)
+            stream.seek(state.offset)
+            for chunk in iter_chunks(stream, RESUMABLE_CHUNK_SIZE):
+                file_handle.write(chunk)
+                file_handle.flush()
+                os.fsync(file_handle.fileno())
+                state.offset += len(chunk)
+                upload_states.save(state)
+                if progress:
+                    progress(state.offset, size)
+        os.replace(state.location, file_path)
 
     def get_signed_url(self, storage_key: str, expires_in: int) -> str:
-        file_path = os.path.join(self.base_path, storage_key)
-        return f"file://{os.path.abspath(file_path)}"
+        if not self.public_url:
+            return f"file://{self.local_path(storage_key)}"
+        expires = int(time.time()) + expires_in
+        token = sign_local_key(self.signing_secret, storage_key, expires)
+        return f"{self.public_url.rstrip('/')}/files/{quote(storage_key)}?expires={expires}&token={token}"
+
+    def get_signed_urls(self, storage_keys: list[str], expires_in: int) -> dict[str, str]:
+        return {storage_key: self.get_signed_url(storage_key, expires_in) for storage_key in storage_keys}
 
     def delete(self, storage_key: str) -> None:
-        file_path = os.path.join(self.base_path, storage_key)
+        file_path = self.local_path(storage_key)
         if os.path.exists(file_path):
             os.remove(file_path)
 
+    def _delete_quietly(self, storage_key: str) -> str | None:
+        try:
+            self.delete(storage_key)
+        except OSError:
+            return storage_key
+        return None
+
+    def delete_many(self, storage_keys: list[str]) -> list[str]:
+        with ThreadPoolExecutor(max_workers=LOCAL_DELETE_WORKERS) as pool:
+            return [storage_key for storage_key in pool.map(self._delete_quietly, storage_keys) if storage_key]
+
+    def exists(self, storage_key: str) -> bool:
+        return os.path.exists(self.local_path(storage_key))
+
+    def size(self, storage_key: str) -> int:
+        return os.path.getsize(self.local_path(storage_key))
+
+    def download_stream(self, storage_key: str) -> Iterator[bytes]:
+        with open(self.local_path(storage_key), "rb") as file_handle:
+            yield from iter_chunks(file_handle)
+
+    def copy(self, source_key: str, target_key: str) -> None:
+        target_path = self.local_path(target_key)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(self.local_path(source_key), target_path)
+        except OSError:
+            shutil.copyfile(self.local_path(source_key), target_path)
+
+
+@dataclass(frozen=True)
+class ContentAddressedAdapter:
+    """Stores each distinct blob once, keyed by the SHA-256 of its contents.
+
+    Keys are shared between documents, so blobs must be removed through
+    blobs.release_blobs(), which only deletes keys nothing references and
+    that have been released for BLOB_DELETION_GRACE_SECONDS.
+    """
+
+    inner: StorageAdapter
+
+    def upload(
+        self, file: BinaryIO | bytes, filename: str, content_type: str, progress: ProgressCallback | None = None
+    ) -> str:
+        # blobs imports this module; it is only needed once a key is known.
+        from blobs import defer_blob_deletion
+
+        stream, digest, size = hash_stream(as_stream(file))
+        storage_key = content_key(digest)
+        # A release of this key may be queued; restart its grace period before
+        # trusting exists(), so it is not deleted before our row commits.
+        defer_blob_deletion(storage_key)
+        if not self.inner.exists(storage_key):
+            self.inner.upload_to(storage_key, stream, content_type, progress)
+        elif progress:
+            progress(size, size)
+        return storage_key
+
+    def upload_to(
+        self,
+        storage_key: str,
+        file: BinaryIO | bytes,
+        content_type: str,
+        progress: ProgressCallback | None = None,
+    ) -> None:
+        self.inner.upload_to(storage_key, file, content_type, progress)
+
+    def get_signed_url(self, storage_key: str, expires_in: int) -> str:
+        return self.inner.get_signed_url(storage_key, expires_in)
+
+    def get_signed_urls(self, storage_keys: list[str], expires_in: int) -> dict[str, str]:
+        return self.inner.get_signed_urls(storage_keys, expires_in)
+
+    def delete(self, storage_key: str) -> None:
+        self.inner.delete(storage_key)
+
+    def delete_many(self, storage_keys: list[str]) -> list[str]:
+        return self.inner.delete_many(storage_keys)
+
+    def exists(self, storage_key: str) -> bool:
+        return self.inner.exists(storage_key)
+
+    def size(self, storage_key: str) -> int:
+        return self.inner.size(storage_key)
+
+    def download_stream(self, storage_key: str) -> Iterator[bytes]:
+        return self.inner.download_stream(storage_key)
+
+    def copy(self, source_key: str, target_key: str) -> None:
+        self.inner.copy(source_key, target_key)
+
+
+@dataclass(frozen=True)
+class InstrumentedAdapter:
+    """Times every call on the wrapped backend; downloads are timed until the stream is exhausted."""
+
+    inner: StorageAdapter
+    backend: str
+
+    def _timed(self, operation: str, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            record_storage_call(operation, self.backend, time.perf_counter() - started)
+
+    def upload(
+        self, file: BinaryIO | bytes, filename: str, content_type: str, progress: ProgressCallback | None = None
+    ) -> str:
+        return self._timed("upload", self.inner.upload, file, filename, content_type, progress)
+
+    def upload_to(
+        self,
+        storage_key: str,
+        file: BinaryIO | bytes,
+        content_type: str,
+        progress: ProgressCallback | None = None,
+    ) -> None:
+        self._timed("upload", self.inner.upload_to, storage_key, file, content_type, progress)
+
+    def get_signed_url(self, storage_key: str, expires_in: int) -> str:
+        return self._timed("sign", self.inner.get_signed_url, storage_key, expires_in)
+
+    def get_signed_urls(self, storage_keys: list[str], expires_in: int) -> dict[str, str]:
+        return self._timed("sign_batch", self.inner.get_signed_urls, storage_keys, expires_in)
+
+    def delete(self, storage_key: str) -> None:
+        self._timed("delete", self.inner.delete, storage_key)
+
+    def delete_many(self, storage_keys: list[str]) -> list[str]:
+        return self._timed("delete_batch", self.inner.delete_many, storage_keys)
+
+    def exists(self, storage_key: str) -> bool:
+        return self._timed("exists", self.inner.exists, storage_key)
+
+    def size(self, storage_key: str) -> int:
+        return self._timed("size", self.inner.size, storage_key)
+
+    def download_stream(self, storage_key: str) -> Iterator[bytes]:
+        started = time.perf_counter()
+        try:
+            yield from self.inner.download_stream(storage_key)
+        finally:
+            record_storage_call("download", self.backend, time.perf_counter() - started)
+
+    def copy(self, source_key: str, target_key: str) -> None:
+        self._timed("copy", self.inner.copy, source_key, target_key)
+
+
+class SignedUrlCache:
+    """Signed URLs shared across sessions, dropped a margin before they expire."""
+
+    def __init__(self, margin_seconds: int = 300, max_entries: int = 10000):
+        self.margin_seconds = margin_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[str, float]] = OrderedDict()
+
+    def get_many(self, adapter: StorageAdapter, storage_keys: list[str], expires_in: int) -> dict[str, str]:
+        now = time.monotonic()
+        urls = {}
+        with self._lock:
+            for storage_key in storage_keys:
+                entry = self._entries.get((adapter, storage_key, expires_in))
+                if entry and entry[1] > now:
+                    urls[storage_key] = entry[0]
+        missing = [storage_key for storage_key in dict.fromkeys(storage_keys) if storage_key not in urls]
+        if missing:
+            fresh = adapter.get_signed_urls(missing, expires_in)
+            # Never hand out a URL within the final margin of its lifetime.
+            refresh_at = now + expires_in - min(self.margin_seconds, expires_in // 2)
+            with self._lock:
+                for storage_key, url in fresh.items():
+                    if url:
+                        self._entries[(adapter, storage_key, expires_in)] = (url, refresh_at)
+                        self._entries.move_to_end((adapter, storage_key, expires_in))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            urls.update(fresh)
+        return urls
+
+    def invalidate(self, adapter: StorageAdapter, storage_key: str) -> None:
+        with self._lock:
+            for cache_key in [key for key in self._entries if key[0] == adapter and key[1] == storage_key]:
+                del self._entries[cache_key]
+
+
+signed_urls = SignedUrlCache(margin_seconds=int(os.getenv("SIGNED_URL_CACHE_MARGIN", "300")))
+
+
+@lru_cache(maxsize=8)
+def _build_adapter(backend: str, content_addressed: bool, *config: str) -> StorageAdapter:
+    if backend == "local":
+        adapter = LocalStorageAdapter(*config)
+    else:
+        adapter = SupabaseStorageAdapter(*config)
+    if INSTRUMENTATION_ENABLED:
+        adapter = InstrumentedAdapter(adapter, backend)
+    if content_addressed:
+        return ContentAddressedAdapter(adapter)
+    return adapter
+
 
-def get_storage_adapter() -> StorageAdapter:
+def get_storage_adapter(content_addressed: bool | None = None) -> StorageAdapter:
+    if content_addressed is None:
+        content_addressed = env_bool("STORAGE_CONTENT_ADDRESSED")
     backend = os.getenv("STORAGE_BACKEND", "supabase").lower()
     if backend == "local":
         base_path = os.getenv("LOCAL_STORAGE_PATH", "./uploads")
-        return LocalStorageAdapter(base_path=base_path)
+        public_url = os.getenv("LOCAL_STORAGE_PUBLIC_URL")
+        signing_secret = os.getenv("LOCAL_STORAGE_SIGNING_SECRET")
+        if public_url and not signing_secret:
+            raise ValueError("LOCAL_STORAGE_PUBLIC_URL requires LOCAL_STORAGE_SIGNING_SECRET")
+        return _build_adapter("local", content_addressed, base_path, public_url, signing_secret)
 
     url = os.getenv("SUPABASE_URL")
     service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -86,4 +808,4 @@ def get_storage_adapter() -> StorageAdapter:
         raise ValueError(
             "Supabase storage requires SUPABASE_URL, SUPABASE_BUCKET, and either SUPABASE_SERVICE_ROLE_KEY or SUPABASE_ANON_KEY"
         )
-    return SupabaseStorageAdapter(url=url, anon_key=api_key, bucket=bucket)
+    return _build_adapter("supabase", content_addressed, url, api_key, bucket)
@@ -0,0 +1,161 @@
+import logging
+import os
+import uuid
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import date
+from typing import BinaryIO, Callable
+
+from blobs import release_blobs
+from cache import invalidate_documents
+from db import get_db_session
+from jobs import JOB_QUEUE_ENABLED, enqueue_job, member_tag
+from models import Document
+from optimize import IMAGE_KEEP_ORIGINAL, optimize_images
+from previews import has_previews, schedule_previews
+from storage import StorageAdapter, as_stream, stream_size
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_WORKERS = int(os.getenv("UPLOAD_MAX_WORKERS", "4"))
+PROGRESS_INTERVAL_SECONDS = 0.25
+
+
+@dataclass
+class PendingUpload:
+    file: BinaryIO | bytes
+    filename: str
+    content_type: str
+
+
+class UploadError(Exception):
+    pass
+
+
+def delete_blobs(adapter: StorageAdapter, storage_keys: list[str]) -> None:
+    try:
+        release_blobs(adapter, storage_keys)
+    except Exception:
+        logger.exception("Failed to remove orphaned uploads %s", storage_keys)
+
+
+def upload_files(
+    adapter: StorageAdapter,
+    uploads: list[PendingUpload],
+    max_workers: int = UPLOAD_MAX_WORKERS,
+    on_progress: Callable[[list[tuple[int, int | None]]], None] | None = None,
+) -> list[str]:
+    """Upload concurrently and return storage keys in input order.
+
+    On the first failure, uploads that have not started are cancelled and
+    every blob that did land is deleted before UploadError is raised.
+    on_progress receives (bytes sent, total) per upload and is called on the
+    calling thread, so it may update Streamlit elements.
+    """
+    if not uploads:
+        return []
+    progress: list[tuple[int, int | None]] = [(0, None)] * len(uploads)
+
+    def reporter(index: int):
+        def report(sent: int, total: int | None) -> None:
+            progress[index] = (sent, total)
+
+        return report
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(uploads)))) as pool:
+        futures = [
+            pool.submit(adapter.upload, upload.file, upload.filename, upload.content_type, reporter(index))
+            for index, upload in enumerate(uploads)
+        ]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=PROGRESS_INTERVAL_SECONDS if on_progress else None,
+                return_when=FIRST_EXCEPTION,
+            )
+            if on_progress:
+                on_progress(list(progress))
+            if any(not future.cancelled() and future.exception() for future in done):
+                break
+        if pending:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+
+    storage_keys = []
+    failure = None
+    for upload, future in zip(uploads, futures):
+        if future.cancelled():
+            continue
+        exc = future.exception()
+        if exc is None:
+            storage_keys.append(future.result())
+        elif failure is None:
+            failure = (upload, exc)
+    if failure:
+        delete_blobs(adapter, storage_keys)
+        upload, exc = failure
+        raise UploadError(f"Failed to upload {upload.filename}: {exc}") from exc
+    return storage_keys
+
+
+def store_documents(
+    adapter: StorageAdapter,
+    uploads: list[PendingUpload],
+    member_id,
+    uploaded_by,
+    doc_date: date,
+    condition: str,
+    description: str | None,
+    on_progress: Callable[[list[tuple[int, int | None]]], None] | None = None,
+) -> list[uuid.UUID]:
+    optimized = optimize_images([(upload.file, upload.content_type) for upload in uploads])
+    stored = [
+        PendingUpload(result.payload, upload.filename, upload.content_type) if result else upload
+        for upload, result in zip(uploads, optimized)
+    ]
+    originals = [upload for upload, result in zip(uploads, optimized) if result and IMAGE_KEEP_ORIGINAL]
+    # Originals are uploaded last so progress entries still line up with `uploads`.
+    storage_keys = upload_files(adapter, stored + originals, on_progress=on_progress)
+    original_keys = iter(storage_keys[len(stored) :])
+    documents = [
+        Document(
+            member_id=member_id,
+            uploaded_by=uploaded_by,
+            doc_date=doc_date,
+            condition=condition,
+            description=description,
+            storage_key=storage_key,
+            file_name=upload.filename,
+            mime_type=upload.content_type,
+            size_bytes=stream_size(as_stream(upload.file)),
+            original_size_bytes=result.original_size if result else None,
+            original_storage_key=next(original_keys) if result and IMAGE_KEEP_ORIGINAL else None,
+        )
+        for upload, result, storage_key in zip(stored, optimized, storage_keys)
+    ]
+    try:
+        with get_db_session() as db:
+            db.add_all(documents)
+            db.flush()
+            document_ids = [document.id for document in documents]
+            if JOB_QUEUE_ENABLED:
+                for document in documents:
+                    if has_previews(document.mime_type):
+                        enqueue_job(db, "generate_previews", {"document_id": str(document.id)}, member_tag(member_id))
+            db.commit()
+    except Exception:
+        delete_blobs(adapter, storage_keys)
+        raise
+    if JOB_QUEUE_ENABLED:
+        return document_ids
+    schedule_previews(
+        adapter,
+        [
+            (document_id, upload.file, upload.filename, upload.content_type)
+            for document_id, upload in zip(document_ids, stored)
+        ],
+        on_done=lambda: invalidate_documents(member_id),
+    )
+    return document_ids